@@ -0,0 +1,191 @@
+"""Offline load benchmark for the backend API.
+
+Runs the real FastAPI app in-process against the stand-in models from
+``benchmarks/fakes.py``, grows a corpus of synthetic audit-report PDFs and
+reports throughput and latency percentiles per endpoint at each corpus size.
+
+    python -m benchmarks.bench_api --sizes 1,5,10 --pages 8 --requests 20 --llm-latency-ms 200
+
+Run it from the ``backend`` directory. ``/upload`` timings include the
+background document processing, since the in-process transport waits for
+background tasks before returning.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SECTIONS = [
+    "Executive Summary",
+    "Scope and Methodology",
+    "Observations",
+    "Affected Systems",
+    "Recommendations",
+    "Appendix",
+]
+
+SENTENCES = [
+    "The assessment team reviewed {system} and identified {issue} affecting {count} hosts.",
+    "Access to {system} was not restricted to authorised administrators during testing.",
+    "Logging on {system} retained events for {count} days, below the required baseline.",
+    "The {issue} on {system} could allow an attacker to escalate privileges.",
+    "Patch levels on {system} lagged the vendor release by {count} weeks.",
+    "Remediation of {issue} should be prioritised for {system} within {count} days.",
+    "Interviews confirmed that {system} owners were unaware of the {issue}.",
+]
+
+SYSTEMS = ["the payroll portal", "the VPN gateway", "the customer API", "the domain controllers", "the mail relay", "the CI pipeline"]
+ISSUES = ["SQL injection", "weak password policy", "missing MFA", "open S3 bucket", "outdated TLS configuration", "verbose error messages"]
+
+def make_report_pdf(index: int, pages: int) -> bytes:
+    """Build a synthetic audit report; the same index always yields the same bytes."""
+    import fitz
+
+    rng = random.Random(index)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        lines = [f"Audit Report {index} - {SECTIONS[page_number % len(SECTIONS)]}", ""]
+        for _ in range(30):
+            lines.append(rng.choice(SENTENCES).format(
+                system=rng.choice(SYSTEMS), issue=rng.choice(ISSUES), count=rng.randint(2, 90),
+            ))
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n".join(lines), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(endpoint: str, corpus_size: int, latencies: List[float], wall: float, errors: int) -> Dict:
+    return {
+        "corpus_size": corpus_size,
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def timed(client, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    return time.perf_counter() - start, response
+
+
+async def run_endpoint(client, endpoint: str, payloads: List[Dict], concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(payload):
+        async with semaphore:
+            return await timed(client, "POST", endpoint, json=payload)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(payload) for payload in payloads))
+    wall = time.perf_counter() - start
+    errors = sum(1 for _, response in results if response.status_code >= 400)
+    return [latency for latency, _ in results], wall, errors
+
+
+async def run(args) -> List[Dict]:
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    rows = []
+    file_ids: List[str] = []
+    filenames: List[str] = []
+    rng = random.Random(0)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for corpus_size in args.sizes:
+            first_row = len(rows)
+            upload_latencies = []
+            upload_start = time.perf_counter()
+            upload_errors = 0
+            while len(file_ids) < corpus_size:
+                index = len(file_ids)
+                filename = f"audit_report_{index:03d}.pdf"
+                payload = {"files": [{"file": base64.b64encode(make_report_pdf(index, args.pages)).decode(), "filename": filename}]}
+                latency, response = await timed(client, "POST", "/upload", json=payload)
+                upload_latencies.append(latency)
+                if response.status_code >= 400:
+                    upload_errors += 1
+                    continue
+                file_ids.append(response.json()["ids"][0][filename])
+                filenames.append(filename)
+            if upload_latencies:
+                rows.append(summarize("/upload", corpus_size, upload_latencies, time.perf_counter() - upload_start, upload_errors))
+
+            workloads = {
+                "/chat": [{"query": f"Which systems are affected by {rng.choice(ISSUES)}?", "history": []} for _ in range(args.requests)],
+                "/summarize": [{"id": rng.choice(file_ids)} for _ in range(args.requests)],
+                "/graph": [None] * args.requests,
+                "/categories": [{"file_list": filenames} for _ in range(args.requests)],
+                "/batch": [{"ids": file_ids} for _ in range(args.requests)],
+            }
+            for endpoint, payloads in workloads.items():
+                latencies, wall, errors = await run_endpoint(client, endpoint, payloads, args.concurrency)
+                rows.append(summarize(endpoint, corpus_size, latencies, wall, errors))
+            print_rows(rows[first_row:], header=first_row == 0)
+    return rows
+
+
+def print_rows(rows: List[Dict], header: bool):
+    if header:
+        print(f"{'docs':>5} {'endpoint':<12} {'n':>4} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(
+            f"{row['corpus_size']:>5} {row['endpoint']:<12} {row['requests']:>4} {row['errors']:>4} "
+            f"{row['throughput_rps']:>8.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+        )
+    sys.stdout.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1,5,10", help="comma separated corpus sizes to measure at")
+    parser.add_argument("--pages", type=int, default=5, help="pages per synthetic report")
+    parser.add_argument("--requests", type=int, default=10, help="requests per endpoint at each corpus size")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight per endpoint")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="latency of each fake LLM call")
+    parser.add_argument("--embed-latency-ms", type=float, default=0, help="latency of each fake embedding batch")
+    parser.add_argument("--uploads-dir", help="corpus directory (defaults to a fresh temporary directory)")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    args.sizes = sorted(int(size) for size in args.sizes.split(","))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["CYBERSTRIKE_MODEL_BACKEND"] = "benchmarks.fakes:FakeBackend"
+    os.environ["CYBERSTRIKE_FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["CYBERSTRIKE_FAKE_EMBED_LATENCY_MS"] = str(args.embed_latency_ms)
+    os.environ["CYBERSTRIKE_UPLOADS_DIR"] = args.uploads_dir or tempfile.mkdtemp(prefix="cyberstrike-bench-")
+    sys.path.insert(0, BACKEND_DIR)
+
+    rows = asyncio.run(run(args))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Cold-start benchmark for the backend.
+
+Measures, over several fresh processes:
+
+- how long ``import main`` takes,
+- how long ``uvicorn main:app`` takes from spawn until ``/health`` answers,
+- how long the first ``/health/deep`` call then takes, which is where the
+  model clients are built now that they are no longer created at import.
+
+    python -m benchmarks.bench_startup --runs 5
+
+Run it from the ``backend`` directory. The stand-in models from
+``benchmarks/fakes.py`` are used unless ``--real`` is given.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float) -> float:
+    """Poll url until it answers; return the time it first did."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return time.perf_counter()
+        except OSError:
+            time.sleep(0.01)
+    raise TimeoutError(f"{url} did not answer in time")
+
+
+def time_import(env) -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL,
+    )
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def time_server(env, timeout: float):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        healthy = wait_for(f"http://127.0.0.1:{port}/health", start + timeout)
+        deep_start = time.perf_counter()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/deep", timeout=timeout):
+            deep = time.perf_counter() - deep_start
+        return healthy - start, deep
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def describe(label: str, values):
+    print(f"{label:<28} median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--real", action="store_true", help="use the configured Gemini/OpenAI models instead of the stand-ins")
+    parser.add_argument("--warmup", action="store_true", help="start the server with CYBERSTRIKE_WARMUP=1")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the server")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault("CYBERSTRIKE_UPLOADS_DIR", tempfile.mkdtemp(prefix="cyberstrike-startup-"))
+    if not args.real:
+        env["CYBERSTRIKE_MODEL_BACKEND"] = "benchmarks.fakes:FakeBackend"
+    if args.warmup:
+        env["CYBERSTRIKE_WARMUP"] = "1"
+
+    imports, ready, deep = [], [], []
+    for _ in range(args.runs):
+        imports.append(time_import(env))
+        until_healthy, first_deep = time_server(env, args.timeout)
+        ready.append(until_healthy)
+        deep.append(first_deep)
+
+    describe("import main", imports)
+    describe("spawn -> /health", ready)
+    describe("first /health/deep", deep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Deterministic stand-ins for the Gemini, OpenAI and embedding models.
+
+Select them with ``CYBERSTRIKE_MODEL_BACKEND=benchmarks.fakes:FakeBackend``.
+Latency is configured through ``CYBERSTRIKE_FAKE_LLM_LATENCY_MS`` (per LLM
+call) and ``CYBERSTRIKE_FAKE_EMBED_LATENCY_MS`` (per embedding batch).
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.base.response.schema import Response
+from llama_index.core.chat_engine.types import AgentChatResponse
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+from main import ModelBackend
+
+VULNERABILITY_NAMES = [
+    "SQL_Injection",
+    "Cross_Site_Scripting",
+    "Broken_Access_Control",
+    "Security_Misconfiguration",
+    "Insecure_Deserialization",
+    "Sensitive_Data_Exposure",
+    "Weak_Password_Policy",
+    "Outdated_Components",
+    "Missing_Rate_Limiting",
+    "Server_Side_Request_Forgery",
+]
+
+CATEGORIES = [
+    "Compliance Audit",
+    "Vulnerability Assessment",
+    "Penetration Testing",
+    "API Security Audit",
+    "Incident Response Audit",
+    "Security Policy Review",
+    "Network Security Audit",
+]
+
+WORDS = (
+    "audit control finding risk network policy access review remediation asset "
+    "exposure patch configuration monitoring incident compliance encryption "
+    "credential endpoint firewall segmentation logging baseline"
+).split()
+
+
+def _rng(text: str) -> random.Random:
+    return random.Random(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16))
+
+
+def _prose(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def fake_completion(prompt: str) -> str:
+    """Answer a prompt with output shaped like what the endpoint expects."""
+    rng = _rng(prompt)
+    if "Classify the following file names" in prompt:
+        match = re.search(r'File Names: "(.*?)"', prompt, re.S)
+        files = [name.strip() for name in match.group(1).split(",")] if match else []
+        assigned = {category: [] for category in CATEGORIES}
+        for name in files:
+            assigned[rng.choice(CATEGORIES)].append(name)
+        return "\n".join(
+            f"{number}. {category}:{json.dumps(names)}"
+            for number, (category, names) in enumerate(assigned.items(), start=1)
+        )
+    if '"vulnerabilities": {' in prompt:
+        documents = re.findall(r"Tool used: tool_(\S+)", prompt) or ["document"]
+        graph = {
+            name: sorted(rng.sample(documents, rng.randint(1, len(documents))))
+            for name in rng.sample(VULNERABILITY_NAMES, 4)
+        }
+        return "```json\n" + json.dumps({"vulnerabilities": graph}, indent=2) + "\n```"
+    if '"criticality"' in prompt:
+        vulnerabilities = [
+            {
+                "description": name.replace("_", " "),
+                "criticality": rng.randint(1, 10),
+                "reasoning": _prose(rng, 12),
+                "mitigation": _prose(rng, 10),
+            }
+            for name in rng.sample(VULNERABILITY_NAMES, 5)
+        ]
+        return json.dumps(vulnerabilities, indent=2)
+    if '"Threat Landscape"' in prompt:
+        findings = {
+            "Threat Landscape": {
+                "Emerging Threats": {
+                    "description": _prose(rng, 10),
+                    "examples": rng.sample(VULNERABILITY_NAMES, 2),
+                    "impact": _prose(rng, 8),
+                },
+                "Attack Vectors": {"common_methods": rng.sample(WORDS, 2), "trends": _prose(rng, 8)},
+            },
+            "Vulnerabilities": {"Critical Issues": {"top_vulnerabilities": rng.sample(VULNERABILITY_NAMES, 3)}},
+            "Incident Response": {
+                "Recent Incidents": {"description": _prose(rng, 10), "response_effectiveness": _prose(rng, 8)}
+            },
+            "Emerging Technologies": {
+                "Impact": {"description": _prose(rng, 10), "associated_risks": rng.sample(WORDS, 2)}
+            },
+            "Compliance and Regulatory Issues": {
+                "Challenges": {"description": _prose(rng, 10), "regulatory_updates": _prose(rng, 8)}
+            },
+        }
+        return "```json\n" + json.dumps(findings, indent=2) + "\n```"
+    if "Say 'Gemini is working!'" in prompt:
+        return "Gemini is working!"
+    return " ".join(_prose(rng, 15) for _ in range(4))
+
+
+class FakeLLM(CustomLLM):
+    """Completion model that sleeps for ``latency`` seconds and answers deterministically."""
+
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-llm")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency)
+        return CompletionResponse(text=fake_completion(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        # Built from fake_completion rather than self.complete(), which would
+        # record a second LLM event for the same call
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.latency)
+            text = fake_completion(prompt)
+            emitted = ""
+            for word in text.split(" "):
+                delta = word if not emitted else " " + word
+                emitted += delta
+                yield CompletionResponse(text=emitted, delta=delta)
+
+        return gen()
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Hashed bag-of-words embeddings; similar texts get similar vectors."""
+
+    embed_dim: int = 256
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.embed_dim
+        for word in re.findall(r"\w+", text.lower()):
+            bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vector[bucket % self.embed_dim] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # One round trip per batch, like the OpenAI embeddings API
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+
+class FakeAgent:
+    """Single-step stand-in for OpenAIAgent.
+
+    Calls the best matching tool once and answers with the LLM, which keeps
+    retrieval and the nested per-document agents on the measured path.
+    """
+
+    def __init__(self, tools=None, tool_retriever=None, llm=None, system_prompt=None):
+        self._tools = list(tools or [])
+        self._tool_retriever = tool_retriever
+        self._llm = llm
+        self._system_prompt = system_prompt or ""
+
+    def chat(self, message: str) -> AgentChatResponse:
+        tools = self._tool_retriever.retrieve(message) if self._tool_retriever else self._tools
+        sources = []
+        context = []
+        for tool in tools[:1]:
+            output = tool.call(message)
+            sources.append(output)
+            context.append(f"Tool used: {tool.metadata.name}\n{output.content}")
+        prompt = "\n\n".join([self._system_prompt, *context, message])
+        response = self._llm.complete(prompt)
+        return AgentChatResponse(response=response.text, sources=sources)
+
+    def query(self, query: str) -> Response:
+        return Response(response=self.chat(str(query)).response)
+
+    def reset(self):
+        pass
+
+
+def _env_seconds(name: str) -> float:
+    return float(os.environ.get(name, "0")) / 1000
+
+
+class FakeBackend(ModelBackend):
+    def __init__(self):
+        self.llm = FakeLLM(latency=_env_seconds("CYBERSTRIKE_FAKE_LLM_LATENCY_MS"))
+        embed_dim = int(os.environ.get("CYBERSTRIKE_FAKE_EMBED_DIM", "256"))
+        self.embed_model = FakeEmbedding(
+            model_name=f"fake-embedding-{embed_dim}",
+            embed_dim=embed_dim,
+            latency=_env_seconds("CYBERSTRIKE_FAKE_EMBED_LATENCY_MS"),
+        )
+
+    def configure(self):
+        super().configure()
+        # Query engines that are not handed an LLM fall back to Settings.llm
+        from llama_index.core import Settings
+        Settings.llm = self.llm
+
+    def function_llm(self):
+        return self.llm
+
+    def build_agent(self, tools=None, tool_retriever=None, llm=None, system_prompt=None):
+        return FakeAgent(tools, tool_retriever, llm or self.llm, system_prompt)
+
+    def summarize_for_tool(self, summary_content) -> str:
+        prompt = f"Please summarize the following content in no more than 100 words for easy tool selection:\n\n{summary_content}"
+        return " ".join(self.llm.complete(prompt).text.split()[:100])
@@ -2,28 +2,30 @@ import os
 import hashlib
 import re
 import json
+import asyncio
 import base64
 import datetime
+import importlib
 import uuid
 import logging
-from typing import List, Dict, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING, List, Dict, Any, Literal, Optional, Tuple
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.gemini import Gemini
-from llama_index.core import Document, Settings, VectorStoreIndex, SummaryIndex
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.core.tools import QueryEngineTool, ToolMetadata
-from llama_index.core.query_engine.router_query_engine import RouterQueryEngine
-from llama_index.core.selectors import LLMSingleSelector
-from llama_index.core import StorageContext
-from llama_index.core.objects import ObjectIndex
-from llama_index.agent.openai import OpenAIAgent
-import fitz 
-import pymupdf4llm
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+# llama_index, the model SDKs, fitz and pymupdf4llm take seconds to import, so
+# they are imported where they are first needed to keep startup fast.
+if TYPE_CHECKING:
+    from llama_index.core import SummaryIndex, VectorStoreIndex
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -39,26 +41,322 @@ app.add_middleware(
     allow_credentials=True
 )
 
-gemini_llm = None
-try:
-    google_api_key = os.environ.get("GOOGLE_API_KEY")
-    if google_api_key:
-        gemini_llm = Gemini(api_key=google_api_key,model='models/gemini-1.5-flash')
-        logger.info("Using Gemini LLM")
-    else:
-        logger.warning("Couldn't find Google API key.")
-except Exception as e:
-    logger.error(f"Error initializing Gemini LLM: {e}")
+# Agents and endpoints only echo prompts and raw LLM output when this is set
+VERBOSE = os.environ.get("CYBERSTRIKE_VERBOSE", "").lower() in ("1", "true", "yes")
+# Clients that send this header get a Server-Timing breakdown of the request back
+TRACE_HEADER = "X-CyberStrike-Trace"
+# Number of most recent samples per metric used to compute percentiles
+METRICS_WINDOW = int(os.environ.get("CYBERSTRIKE_METRICS_WINDOW", "2048"))
+METRICS_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+_current_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("cyberstrike_trace", default=None)
+
+class Metrics:
+    """Thread-safe timing summaries and counters rendered in Prometheus text format."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._window = window
+        self._samples: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], deque] = {}
+        self._totals: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._help: Dict[str, str] = {}
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self._window)
+                self._totals[key] = [0.0, 0]
+            self._samples[key].append(seconds)
+            self._totals[key][0] += seconds
+            self._totals[key][1] += 1
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    @staticmethod
+    def _format_labels(labels, **extra) -> str:
+        items = list(labels) + list(extra.items())
+        if not items:
+            return ""
+        escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        # Large counters must keep every digit, or rate() over them steps
+        value = float(value)
+        return str(int(value)) if value.is_integer() else repr(value)
+
+    def render(self) -> str:
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            totals = {key: tuple(value) for key, value in self._totals.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name in sorted({key[0] for key in samples}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} summary")
+            for key in sorted(k for k in samples if k[0] == name):
+                values = samples[key]
+                for q in METRICS_QUANTILES:
+                    value = values[min(len(values) - 1, int(q * len(values)))]
+                    lines.append(f"{name}{self._format_labels(key[1], quantile=q)} {value:.6f}")
+                lines.append(f"{name}_sum{self._format_labels(key[1])} {totals[key][0]:.6f}")
+                lines.append(f"{name}_count{self._format_labels(key[1])} {totals[key][1]}")
+        for name in sorted({key[0] for key in counters}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key in sorted(k for k in counters if k[0] == name):
+                lines.append(f"{name}{self._format_labels(key[1])} {self._format_value(counters[key])}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("cyberstrike_span_seconds", "Time spent in instrumented stages of request handling.")
+metrics.describe("cyberstrike_http_request_seconds", "End-to-end HTTP request latency.")
+metrics.describe("cyberstrike_llm_tokens_total", "LLM and embedding tokens, as reported by the provider or estimated.")
+metrics.describe("cyberstrike_cache_requests_total", "Cache lookups by cache and result.")
+metrics.describe("cyberstrike_llm_json_total", "JSON answers parsed from LLM output, by whether they needed repair or were truncated.")
+metrics.describe("cyberstrike_llm_json_follow_ups_total", "Extra completions requested for the missing part of a JSON answer.")
+metrics.describe("cyberstrike_llm_json_invalid_items_total", "Items dropped from JSON answers for failing schema validation.")
+metrics.describe("cyberstrike_documents_deleted_total", "Documents deleted or replaced.")
+metrics.describe("cyberstrike_corpus_document_failures_total", "Documents that could not be embedded or summarized for a corpus version.")
+metrics.describe("cyberstrike_documents_reindexed_total", "Documents re-chunked after a chunker change.")
+metrics.describe("cyberstrike_gc_files_removed_total", "Files removed by garbage collection, by kind.")
+metrics.describe("cyberstrike_analysis_deduplicated_total", "Analysis requests that joined one already running.")
+
+def record_span(name: str, seconds: float):
+    metrics.observe("cyberstrike_span_seconds", seconds, span=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((name, seconds))
+
+@contextmanager
+def span(name: str):
+    """Time a block as a named stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def record_cache(cache: str, hit: bool):
+    metrics.inc("cyberstrike_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+_token_counter = None
+
+def token_counter():
+    # tiktoken downloads its encoding on first use, so build it lazily and
+    # fall back to rough counts when running offline.
+    global _token_counter
+    if _token_counter is None:
+        from llama_index.core.callbacks.token_counting import TokenCounter
+        from llama_index.core.utils import get_tokenizer
+
+        try:
+            tokenizer = get_tokenizer()
+        except Exception as e:
+            logger.warning(f"Falling back to whitespace token counts: {e}")
+            tokenizer = str.split
+        _token_counter = TokenCounter(tokenizer=tokenizer)
+    return _token_counter
+
+def record_llm_tokens(prompt_tokens: int, completion_tokens: int):
+    metrics.inc("cyberstrike_llm_tokens_total", prompt_tokens, kind="prompt")
+    metrics.inc("cyberstrike_llm_tokens_total", completion_tokens, kind="completion")
+
+def install_metrics_handler():
+    """Register the llama_index callback handler that feeds span timings and token counts."""
+    import llama_index.core
+    from llama_index.core.callbacks import CBEventType, EventPayload
+    from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+    from llama_index.core.callbacks.token_counting import get_llm_token_counts
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        """Times LLM, embedding and retrieval events and counts their tokens."""
+
+        SPANS = {
+            CBEventType.LLM: "llm",
+            CBEventType.EMBEDDING: "embed",
+            CBEventType.RETRIEVE: "retrieve",
+        }
 
-if not gemini_llm:
-    raise ValueError("Failed to initialize Gemini LLM. Please check your Google API key.")
+        def __init__(self):
+            super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+            self._starts: Dict[str, float] = {}
+
+        def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs) -> str:
+            if event_type in self.SPANS:
+                self._starts[event_id] = time.perf_counter()
+            return event_id
+
+        def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+            start = self._starts.pop(event_id, None)
+            if start is not None:
+                record_span(self.SPANS[event_type], time.perf_counter() - start)
+            if payload is None:
+                return
+            if event_type == CBEventType.LLM:
+                counts = get_llm_token_counts(token_counter(), payload, event_id)
+                record_llm_tokens(counts.prompt_token_count, counts.completion_token_count)
+            elif event_type == CBEventType.EMBEDDING:
+                tokens = sum(token_counter().get_string_tokens(chunk) for chunk in payload.get(EventPayload.CHUNKS, []))
+                metrics.inc("cyberstrike_llm_tokens_total", tokens, kind="embedding")
+
+        def start_trace(self, trace_id=None):
+            pass
+
+        def end_trace(self, trace_id=None, trace_map=None):
+            pass
+
+    # Every llama_index callback manager picks up the global handler, including ones
+    # created inside agents and query engines we never see.
+    llama_index.core.global_handler = MetricsCallbackHandler()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace: List[Tuple[str, float]] = []
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current_trace.reset(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    metrics.observe("cyberstrike_http_request_seconds", elapsed, method=request.method, path=path, status=str(response.status_code))
+    if request.headers.get(TRACE_HEADER):
+        timings = [f'{re.sub(r"[^a-zA-Z0-9_-]", "_", name)};dur={seconds * 1000:.1f}' for name, seconds in trace]
+        timings.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+# "module:Class" of the ModelBackend to use instead of Gemini/OpenAI, e.g. the
+# deterministic stand-ins in benchmarks/fakes.py
+MODEL_BACKEND = os.environ.get("CYBERSTRIKE_MODEL_BACKEND", "")
+
+class ModelBackend:
+    """Supplies the LLMs, embedding model and agents used by the endpoints.
+
+    Subclass it and point CYBERSTRIKE_MODEL_BACKEND at the subclass to run the
+    service against other models. Clients are built on first use.
+    """
 
-Settings.embed_model = OpenAIEmbedding(model="text-embedding-3-small")
+    @cached_property
+    def llm(self):
+        from llama_index.llms.gemini import Gemini
+
+        llm = None
+        try:
+            google_api_key = os.environ.get("GOOGLE_API_KEY")
+            if google_api_key:
+                llm = Gemini(api_key=google_api_key,model='models/gemini-1.5-flash')
+                logger.info("Using Gemini LLM")
+            else:
+                logger.warning("Couldn't find Google API key.")
+        except Exception as e:
+            logger.error(f"Error initializing Gemini LLM: {e}")
+
+        if not llm:
+            raise RuntimeError("Failed to initialize Gemini LLM. Please check your Google API key.")
+        return llm
+
+    @cached_property
+    def embed_model(self):
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        return OpenAIEmbedding(model="text-embedding-3-small")
+
+    def configure(self):
+        """Install the backend's models as llama_index defaults."""
+        from llama_index.core import Settings
+        Settings.embed_model = self.embed_model
+
+    def function_llm(self):
+        """LLM that drives the per-document agents."""
+        from llama_index.llms.openai import OpenAI
+        return OpenAI(model="gpt-4o-mini")
+
+    def build_agent(self, tools=None, tool_retriever=None, llm=None, system_prompt=None):
+        from llama_index.agent.openai import OpenAIAgent
+        return OpenAIAgent.from_tools(
+            tools,
+            tool_retriever=tool_retriever,
+            llm=llm,
+            system_prompt=system_prompt,
+            verbose=VERBOSE,
+        )
+
+    def summarize_for_tool(self, summary_content) -> str:
+        """Short description of a document that the top agent picks its tool by.
+
+        Raises on failure; callers that persist the result must not store errors.
+        """
+        prompt = f"Please summarize the following content in no more than 100 words for easy tool selection:\n\n{summary_content}"
+        return self.function_llm().complete(prompt).text.strip()
+
+def load_model_backend() -> ModelBackend:
+    if not MODEL_BACKEND:
+        return ModelBackend()
+    module_name, _, class_name = MODEL_BACKEND.partition(":")
+    backend_cls = getattr(importlib.import_module(module_name), class_name)
+    logger.info(f"Using model backend {MODEL_BACKEND}")
+    return backend_cls()
+
+_model_backend: Optional[ModelBackend] = None
+_model_backend_lock = threading.Lock()
+
+def get_model_backend() -> ModelBackend:
+    """Return the configured ModelBackend, creating it on first call."""
+    global _model_backend
+    if _model_backend is None:
+        with _model_backend_lock:
+            if _model_backend is None:
+                with span("model_init"):
+                    install_metrics_handler()
+                    backend = load_model_backend()
+                    backend.configure()
+                _model_backend = backend
+    return _model_backend
 
 document_store = {}
-UPLOADS_DIR = "uploads"
+UPLOADS_DIR = os.environ.get("CYBERSTRIKE_UPLOADS_DIR", "uploads")
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# Directory shared by all uvicorn workers. When set, one worker ingests uploads
+# and publishes corpus versions there, and every worker serves from them.
+SHARED_STATE_DIR = os.environ.get("CYBERSTRIKE_SHARED_DIR", "")
+# How often workers look for a newly published corpus version, in seconds
+CORPUS_POLL_INTERVAL = float(os.environ.get("CYBERSTRIKE_CORPUS_POLL_SECONDS", "1"))
+# Superseded versions kept on disk for workers that have not switched yet
+CORPUS_VERSIONS_KEPT = 3
+# First delay before retrying a document that could not be published; doubles per failure
+PUBLISH_RETRY_SECONDS = float(os.environ.get("CYBERSTRIKE_PUBLISH_RETRY_SECONDS", "30"))
+
+# Chunking of stored documents. Documents chunked with other settings are
+# re-chunked from their stored text by the maintenance pass.
+CHUNK_SIZE = int(os.environ.get("CYBERSTRIKE_CHUNK_SIZE", "1024"))
+CHUNK_OVERLAP = int(os.environ.get("CYBERSTRIKE_CHUNK_OVERLAP", "200"))
+# Seconds between maintenance passes (reindexing, compaction and garbage collection)
+MAINTENANCE_INTERVAL = float(os.environ.get("CYBERSTRIKE_MAINTENANCE_SECONDS", "300"))
+# Uploads and temporary files this old without a processed document are garbage
+ORPHAN_GRACE_SECONDS = float(os.environ.get("CYBERSTRIKE_ORPHAN_GRACE_SECONDS", "3600"))
+# Results derived from a document's text, written next to it in UPLOADS_DIR
+DERIVED_SUFFIXES = ("_findings.json", "_vulnerabilities.json", "_summary.json")
+DOCUMENT_ID = re.compile(r"[0-9a-f]{32}")
+if SHARED_STATE_DIR:
+    os.makedirs(os.path.join(SHARED_STATE_DIR, "versions"), exist_ok=True)
+    os.makedirs(os.path.join(SHARED_STATE_DIR, "queue"), exist_ok=True)
+
 class FileUpload(BaseModel):
     file: str
     filename: str
@@ -107,47 +405,535 @@ class CategoriesRequest(BaseModel):
 
 class CategoriesResponse(BaseModel):
     categories: Dict[str, List[str]]
+
+class BatchRequest(BaseModel):
+    ids: List[str]
+    analyses: List[Literal["fileinfo", "keyfindings", "vulnerabilities", "summary"]] = ["fileinfo", "keyfindings", "vulnerabilities", "summary"]
+    stream: bool = False
+
+class BatchResult(BaseModel):
+    id: str
+    analysis: str
+    status: str
+    cached: bool = False
+    result: Any = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+class DeleteResponse(BaseModel):
+    status: str
+    id: str
+
+class ReplaceResponse(BaseModel):
+    status: str
+    id: str
+    replaced: str
     
-def clean_llm_response(response: str) -> str:
-    """Remove Markdown code block syntax and any additional text from the LLM response."""
-    cleaned = re.sub(r'^```json\s*', '', response.strip())
-    cleaned = re.sub(r'\s*```$', '', cleaned)
-    cleaned = re.sub(r'^[^{]*', '', cleaned)
-    cleaned = re.sub(r'[^}]*$', '', cleaned)
-    return cleaned
+# Extra completions allowed for asking the LLM for the part of an answer it left out
+JSON_FOLLOW_UPS = int(os.environ.get("CYBERSTRIKE_JSON_FOLLOW_UPS", "1"))
+
+class StreamingJSONParser:
+    """Incremental, tolerant parser for the first JSON value in LLM output.
+
+    Feed chunks as they arrive; feed() returns True once the value is closed, so
+    the caller can stop reading the stream. Code fences and surrounding prose,
+    comments, single and smart quotes, unquoted keys, Python literals, raw
+    control characters and stray quotes in strings, and missing or trailing
+    commas are repaired. If the text ends early, result() returns the longest
+    prefix made of complete elements and reports it as incomplete.
+    """
+
+    TOKEN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.+-")
+    LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+    STRING_CLOSERS = {'"': '"', "'": "'", "“": "”“\"", "”": "”“\""}
+    # A quote only ends a string when the next non-space character is one of these
+    AFTER_STRING = frozenset(",:{}]/\"'“”")
+    ESCAPES = frozenset('"\\/bfnrt')
+
+    def __init__(self, opener: Optional[str] = None):
+        self._openers = opener or "{["
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._implicit_array = False
+        self._out: List[str] = []
+        # [closer, expected next ("key", "colon", "value" or "comma"), output index of the pending key]
+        self._stack: List[list] = []
+        # (output length, closers) after every complete element
+        self._safe: List[Tuple[int, Tuple[str, ...]]] = []
+        self.done = False
+        self.repaired = False
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def feed(self, chunk: str) -> bool:
+        self._buffer += chunk
+        self._scan(final=False)
+        return self.done
+
+    def result(self) -> Tuple[Any, bool]:
+        """Return the parsed value and whether the input contained all of it."""
+        if not self.done:
+            self._scan(final=True)
+        if not self._started:
+            raise ValueError("No valid JSON found in the response")
+        if self.done:
+            return json.loads("".join(self._out)), True
+        if self._implicit_array and len(self._stack) == 1 and self._stack[0][1] in ("value", "comma"):
+            out = self._out[:-1] if self._out[-1] == "," else self._out
+            return json.loads("".join(out) + "]"), True
+        length, closers = self._safe[-1]
+        out = self._out[:length]
+        if out[-1] == ",":
+            out = out[:-1]
+        return json.loads("".join(out) + "".join(reversed(closers))), False
+
+    def _start(self, final: bool) -> bool:
+        buf = self._buffer
+        if self._openers != "[":
+            positions = [p for p in (buf.find(c, self._pos) for c in self._openers) if p != -1]
+            if not positions:
+                return False
+            self._pos = min(positions)
+            self._started = True
+            return True
+        while True:
+            bracket = buf.find("[", self._pos)
+            brace = buf.find("{", self._pos)
+            if brace != -1 and (bracket == -1 or brace < bracket):
+                # Objects listed one after another without the enclosing array
+                self._pos = brace
+                self._out.append("[")
+                self._stack.append(["]", "value", None])
+                self._safe.append((1, ("]",)))
+                self._started = self._implicit_array = self.repaired = True
+                return True
+            if bracket == -1:
+                self._pos = len(buf)
+                return False
+            self._pos = bracket
+            following = buf[bracket + 1:].lstrip()
+            if not following and not final:
+                return False
+            if following and following[0].isalpha():
+                # A bracket in prose, such as "(see [below])"
+                self._pos += 1
+                continue
+            self._started = True
+            return True
+
+    def _begin_element(self) -> str:
+        """Role of the element about to be written, inserting a missing ',' or ':'."""
+        if not self._stack:
+            return "value"
+        entry = self._stack[-1]
+        if entry[1] == "comma":
+            self._out.append(",")
+            entry[1] = "key" if entry[0] == "}" else "value"
+            self.repaired = True
+        elif entry[1] == "colon":
+            self._out.append(":")
+            entry[1] = "value"
+            self.repaired = True
+        return entry[1]
+
+    def _value_done(self):
+        if not self._stack:
+            self.done = True
+            return
+        self._stack[-1][1] = "comma"
+        self._safe.append((len(self._out), tuple(entry[0] for entry in self._stack)))
+
+    def _close(self, closer: str):
+        entry = self._stack[-1]
+        if closer != entry[0]:
+            self.repaired = True
+        if entry[0] == "}" and entry[1] in ("colon", "value"):
+            # Key without a value
+            self._truncate(entry[2])
+            self.repaired = True
+        if self._out[-1] == ",":
+            self._truncate(len(self._out) - 1)
+            self.repaired = True
+        self._out.append(entry[0])
+        self._stack.pop()
+        self._value_done()
+
+    def _truncate(self, length: int):
+        del self._out[length:]
+        self._safe = [point for point in self._safe if point[0] <= length]
+
+    def _scan(self, final: bool):
+        if not self._started and not self._start(final):
+            return
+        buf = self._buffer
+        while self._pos < len(buf) and not self.done:
+            c = buf[self._pos]
+            if c.isspace():
+                self._pos += 1
+            elif self._implicit_array and len(self._stack) == 1 and c != "{":
+                # Only objects belong to the implied array; skip separators and prose between them
+                self._pos += 1
+            elif c == "/" and buf.startswith(("//", "/*"), self._pos):
+                end = buf.find("\n" if buf[self._pos + 1] == "/" else "*/", self._pos + 2)
+                if end == -1:
+                    if not final:
+                        return
+                    end = len(buf)
+                self._pos = end + (1 if buf[self._pos + 1] == "/" else 2)
+                self.repaired = True
+            elif c == "/" and self._pos + 1 == len(buf) and not final:
+                return
+            elif c in "{[":
+                if self._stack and self._stack[-1][0] == "}" and self._stack[-1][1] in ("key", "comma"):
+                    self.repaired = True
+                    if c == "{" and len(self._stack) > 1 and self._stack[-2][0] == "]":
+                        # The previous object in the list was never closed
+                        self._close("}")
+                    else:
+                        self._pos += 1
+                    continue
+                self._begin_element()
+                self._out.append(c)
+                self._stack.append(["}" if c == "{" else "]", "key" if c == "{" else "value", None])
+                self._safe.append((len(self._out), tuple(entry[0] for entry in self._stack)))
+                self._pos += 1
+            elif c in "}]":
+                self._close(c)
+                self._pos += 1
+            elif c == ",":
+                entry = self._stack[-1]
+                if entry[1] == "comma":
+                    self._out.append(",")
+                    entry[1] = "key" if entry[0] == "}" else "value"
+                else:
+                    self.repaired = True
+                self._pos += 1
+            elif c == ":":
+                entry = self._stack[-1]
+                if entry[1] == "colon":
+                    self._out.append(":")
+                    entry[1] = "value"
+                else:
+                    self.repaired = True
+                self._pos += 1
+            elif c in self.STRING_CLOSERS:
+                string = self._read_string(final)
+                if string is None:
+                    if final:
+                        self._pos = len(buf)
+                    return
+                self._write_scalar(string[0], is_string=True)
+                self._pos = string[1]
+            elif c in self.TOKEN_CHARS:
+                end = self._pos
+                while end < len(buf) and buf[end] in self.TOKEN_CHARS:
+                    end += 1
+                if end == len(buf):
+                    # The token may continue in the next chunk, or was cut off
+                    if final:
+                        self._pos = end
+                    return
+                self._write_scalar(buf[self._pos:end], is_string=False)
+                self._pos = end
+            else:
+                self._pos += 1
+                self.repaired = True
+
+    def _write_scalar(self, token: str, is_string: bool):
+        role = self._begin_element()
+        entry = self._stack[-1] if self._stack else None
+        if role == "key":
+            entry[2] = len(self._out)
+            self._out.append(token if is_string else json.dumps(token))
+            entry[1] = "colon"
+            self.repaired = self.repaired or not is_string
+            return
+        if not is_string:
+            if token in self.LITERALS:
+                self.repaired = self.repaired or token != self.LITERALS[token]
+                token = self.LITERALS[token]
+            else:
+                try:
+                    number = json.loads(token)
+                    if not isinstance(number, (int, float)):
+                        raise ValueError
+                except ValueError:
+                    try:
+                        number = float(token)
+                        token = json.dumps(int(number) if number.is_integer() else number)
+                    except (ValueError, OverflowError):
+                        token = json.dumps(token)
+                    self.repaired = True
+        self._out.append(token)
+        self._value_done()
+
+    def _read_string(self, final: bool) -> Optional[Tuple[str, int]]:
+        """Return the string at the current position as JSON text and the index after it."""
+        buf = self._buffer
+        opener = buf[self._pos]
+        closers = self.STRING_CLOSERS[opener]
+        if opener != '"':
+            self.repaired = True
+        chars = ['"']
+        i = self._pos + 1
+        while i < len(buf):
+            ch = buf[i]
+            if ch == "\\":
+                if i + 1 == len(buf):
+                    break
+                nxt = buf[i + 1]
+                if nxt == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", buf[i + 2:i + 6]):
+                    chars.append(buf[i:i + 6])
+                    i += 6
+                elif nxt == "u" and len(buf) < i + 6 and not final:
+                    break
+                elif nxt in self.ESCAPES:
+                    chars.append(ch + nxt)
+                    i += 2
+                elif nxt == "'":
+                    chars.append("'")
+                    i += 2
+                else:
+                    chars.append("\\\\")
+                    i += 1
+                    self.repaired = True
+                continue
+            if ch in closers:
+                rest = buf[i + 1:]
+                following = rest.lstrip()
+                if not following and not final:
+                    break
+                if not following or following[0] in self.AFTER_STRING or "\n" in rest[:len(rest) - len(following)]:
+                    chars.append('"')
+                    return "".join(chars), i + 1
+                # Quote inside the string that should have been escaped
+                self.repaired = True
+            if ch == '"':
+                chars.append('\\"')
+            elif ch < " ":
+                chars.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(ch, f"\\u{ord(ch):04x}"))
+                self.repaired = True
+            else:
+                chars.append(ch)
+            i += 1
+        return None
+
+def parse_llm_json(text: str, opener: Optional[str] = None) -> Tuple[Any, bool]:
+    """Parse the first JSON value in an LLM response; see StreamingJSONParser."""
+    parser = StreamingJSONParser(opener)
+    with span("json_repair"):
+        parser.feed(text)
+        value, complete = parser.result()
+    record_json_parse(parser, complete)
+    return value, complete
+
+def record_json_parse(parser: StreamingJSONParser, complete: bool):
+    result = "truncated" if not complete else "repaired" if parser.repaired else "clean"
+    metrics.inc("cyberstrike_llm_json_total", result=result)
+
+def complete_json(prompt: str, opener: str) -> Tuple[Any, bool]:
+    """Stream a completion through StreamingJSONParser, stopping once the JSON value closes."""
+    parser = StreamingJSONParser(opener)
+    stream = get_model_backend().llm.stream_complete(prompt)
+    text = ""
+    stopped_early = False
+    try:
+        for chunk in stream:
+            delta = chunk.delta if chunk.delta is not None else chunk.text[len(text):]
+            text += delta
+            if parser.feed(delta):
+                stopped_early = True
+                break
+    finally:
+        stream.close()
+    if stopped_early:
+        # Closing the stream ends the LLM event without its prompt and
+        # completion, so the metrics handler cannot count them
+        counter = token_counter()
+        record_llm_tokens(counter.get_string_tokens(prompt), counter.get_string_tokens(text))
+    if not text.strip():
+        raise ValueError("Empty response from LLM")
+    logger.debug(f"LLM Response: {text}")
+    with span("json_repair"):
+        value, complete = parser.result()
+    record_json_parse(parser, complete)
+    return value, complete
+
+class Vulnerability(BaseModel):
+    description: str
+    criticality: int = Field(ge=1, le=10)
+    # Required so that an item cut off part-way is dropped and asked for again
+    reasoning: str
+    mitigation: str
+
+class KeyFindings(BaseModel):
+    """Sections the /keyfindings prompt asks for; all of them are required."""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    threat_landscape: Dict[str, Any] = Field(alias="Threat Landscape")
+    vulnerabilities: Dict[str, Any] = Field(alias="Vulnerabilities")
+    incident_response: Dict[str, Any] = Field(alias="Incident Response")
+    emerging_technologies: Dict[str, Any] = Field(alias="Emerging Technologies")
+    compliance: Dict[str, Any] = Field(alias="Compliance and Regulatory Issues")
+
+class VulnerabilityGraph(BaseModel):
+    vulnerabilities: Dict[str, List[str]]
+
+def request_missing_key_findings(findings: Dict[str, Any], complete: bool, prompt: str, full_text: str) -> Dict[str, Any]:
+    """Ask the LLM for just the sections a truncated or partial answer lacks."""
+    missing = missing_key_findings(findings)
+    if not complete and findings:
+        # The last section may have been cut off part-way through
+        missing.append(next(reversed(findings)))
+    for _ in range(JSON_FOLLOW_UPS):
+        if not missing:
+            break
+        metrics.inc("cyberstrike_llm_json_follow_ups_total", schema="key_findings")
+        follow_up = (
+            prompt
+            + f"\nReturn ONLY these sections, as a JSON object in the same format: {json.dumps(sorted(set(missing)))}"
+            + "\n\nDocument content:\n" + full_text
+        )
+        try:
+            sections, complete = complete_json(follow_up, "{")
+        except ValueError as e:
+            logger.warning(f"Follow-up for missing key findings failed: {e}")
+            break
+        findings.update({name: value for name, value in sections.items() if name in missing})
+        missing = missing_key_findings(findings)
+        if not complete and sections:
+            missing.append(next(reversed(sections)))
+    return findings
+
+def request_missing_vulnerabilities(vulnerabilities: List[Dict[str, Any]], complete: bool, prompt: str, full_text: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """Ask the LLM for the rest of a truncated vulnerability list, not the whole list again.
+
+    Returns the list and whether it is complete.
+    """
+    for _ in range(JSON_FOLLOW_UPS):
+        if complete:
+            break
+        metrics.inc("cyberstrike_llm_json_follow_ups_total", schema="vulnerabilities")
+        follow_up = (
+            prompt
+            + "\nYour previous answer was cut off after these vulnerabilities: "
+            + json.dumps([v["description"] for v in vulnerabilities])
+            + "\nReturn ONLY the remaining vulnerabilities as a JSON array in the same format, or [] if there are none."
+            + "\n\nDocument content:\n" + full_text
+        )
+        try:
+            items, complete = complete_json(follow_up, "[")
+        except ValueError as e:
+            logger.warning(f"Follow-up for remaining vulnerabilities failed: {e}")
+            break
+        seen = {v["description"].strip().lower() for v in vulnerabilities}
+        vulnerabilities = vulnerabilities + [v for v in valid_vulnerabilities(items) if v["description"].strip().lower() not in seen]
+    return vulnerabilities, complete
+
+def missing_key_findings(findings: Dict[str, Any]) -> List[str]:
+    return [field.alias for field in KeyFindings.model_fields.values() if not isinstance(findings.get(field.alias), dict)]
+
+def valid_vulnerabilities(items: Any) -> List[Dict[str, Any]]:
+    """Keep the items that match the Vulnerability schema, dropping the rest."""
+    if isinstance(items, dict):
+        items = [items]
+    if len(items) == 1 and isinstance(items[0], dict) and "description" not in items[0]:
+        # The list wrapped in an object, e.g. {"vulnerabilities": [...]}
+        lists = [value for value in items[0].values() if isinstance(value, list)]
+        if len(lists) == 1:
+            items = lists[0]
+    valid = []
+    for item in items:
+        try:
+            valid.append(Vulnerability.model_validate(item).model_dump())
+        except ValidationError as e:
+            logger.warning(f"Dropping invalid vulnerability {item!r}: {e}")
+            metrics.inc("cyberstrike_llm_json_invalid_items_total", schema="vulnerability")
+    return valid
+
+def info_mtime(file_id: str) -> Optional[int]:
+    try:
+        return os.stat(os.path.join(UPLOADS_DIR, f"{file_id}_info.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+_document_loads_lock = threading.Lock()
+_document_loads: Dict[str, threading.Lock] = {}
+
+def cached_document_info(file_id: str, mtime: Optional[int]) -> Optional[Dict[str, Any]]:
+    # A cached entry is only valid for the info file it was loaded from, which
+    # another worker may have deleted or rewritten since
+    cached = document_store.get(file_id)
+    if cached is not None and mtime is not None and cached.get("info_mtime_ns") == mtime:
+        return cached
+    return None
 
 def get_document_info(file_id: str) -> Dict[str, Any]:
-    if file_id in document_store:
-        return document_store[file_id]
-    
-    info_path = os.path.join(UPLOADS_DIR, f"{file_id}_info.json")
-    if os.path.exists(info_path):
-        with open(info_path, 'r') as f:
-            doc_info = json.load(f)
-   
-        if 'full_text' in doc_info and 'nodes' in doc_info:
-            document = Document(text=doc_info['full_text'])
-            nodes = [Document.from_dict(node) for node in doc_info['nodes']]
-            doc_info['index'] = VectorStoreIndex(nodes)
-        
-        document_store[file_id] = doc_info
-        return doc_info
-    
+    cached = cached_document_info(file_id, info_mtime(file_id))
+    if cached is not None:
+        record_cache("document_store", True)
+        return cached
+
+    # Analyses of one document run in parallel threads; the first one loads
+    # the info file and the others wait for it instead of loading it again.
+    # The lock only lives while a load is running.
+    with _document_loads_lock:
+        load_lock = _document_loads.setdefault(file_id, threading.Lock())
+    try:
+        with load_lock:
+            mtime = info_mtime(file_id)
+            cached = cached_document_info(file_id, mtime)
+            if cached is not None:
+                record_cache("document_store", True)
+                return cached
+            record_cache("document_store", False)
+            document_store.pop(file_id, None)
+
+            info_path = os.path.join(UPLOADS_DIR, f"{file_id}_info.json")
+            if mtime is not None:
+                with open(info_path, 'r') as f:
+                    doc_info = json.load(f)
+                doc_info["info_mtime_ns"] = mtime
+
+                document_store[file_id] = doc_info
+                return doc_info
+    finally:
+        with _document_loads_lock:
+            if _document_loads.get(file_id) is load_lock:
+                del _document_loads[file_id]
+
     raise HTTPException(status_code=404, detail="Document not found")
 
+def store_upload(file_upload: FileUpload, background_tasks: BackgroundTasks, replaces: Optional[str] = None) -> str:
+    """Save an uploaded PDF and schedule its processing; returns its id."""
+    file_content = base64.b64decode(file_upload.file)
+    file_hash = hashlib.md5(file_content).hexdigest()
+    if replaces == file_hash:
+        replaces = None
+    
+    file_path = os.path.join(UPLOADS_DIR, f"{file_hash}.pdf")
+    with open(file_path, "wb") as f:
+        f.write(file_content)
+
+    if SHARED_STATE_DIR:
+        enqueue_upload(file_path, file_hash, file_upload.filename, replaces)
+    elif replaces:
+        background_tasks.add_task(process_replacement, file_path, file_hash, file_upload.filename, replaces)
+    else:
+        background_tasks.add_task(process_document, file_path, file_hash, file_upload.filename)
+    return file_hash
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload_documents(upload_request: UploadRequest, background_tasks: BackgroundTasks):
     try:
         file_ids = []
         for file_upload in upload_request.files:
-            file_content = base64.b64decode(file_upload.file)
-            file_hash = hashlib.md5(file_content).hexdigest()
-            
-            file_path = os.path.join(UPLOADS_DIR, f"{file_hash}.pdf")
-            with open(file_path, "wb") as f:
-                f.write(file_content)
-
-            background_tasks.add_task(process_document, file_path, file_hash, file_upload.filename)
+            file_hash = store_upload(file_upload, background_tasks)
             file_ids.append({file_upload.filename: file_hash})
         
         user_hash = uuid.uuid4().hex  
@@ -156,6 +942,35 @@ async def upload_documents(upload_request: UploadRequest, background_tasks: Back
     except Exception as e:
         logger.error(f"Error processing upload: {e}")
         raise HTTPException(status_code=500, detail="Error processing upload")
+
+def document_exists(file_id: str) -> bool:
+    return bool(DOCUMENT_ID.fullmatch(file_id)) and (
+        os.path.exists(os.path.join(UPLOADS_DIR, f"{file_id}_info.json"))
+        or os.path.exists(os.path.join(UPLOADS_DIR, f"{file_id}.pdf"))
+    )
+
+@app.delete("/documents/{file_id}", response_model=DeleteResponse)
+async def delete_document_endpoint(file_id: str):
+    if not document_exists(file_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    delete_document(file_id)
+    return DeleteResponse(status="deleted", id=file_id)
+
+@app.put("/documents/{file_id}", response_model=ReplaceResponse)
+async def replace_document_endpoint(file_id: str, file_upload: FileUpload, background_tasks: BackgroundTasks):
+    """Upload a new version of a document.
+
+    The old version keeps being served until the new one has been processed,
+    then it is deleted along with everything derived from it.
+    """
+    if not document_exists(file_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        new_id = store_upload(file_upload, background_tasks, replaces=file_id)
+    except Exception as e:
+        logger.error(f"Error processing replacement for {file_id}: {e}")
+        raise HTTPException(status_code=500, detail="Error processing upload")
+    return ReplaceResponse(status="success", id=new_id, replaced=file_id)
     
 class DocumentProcessor:
     def __init__(self, file_path: str):
@@ -165,22 +980,76 @@ class DocumentProcessor:
         self.summary_index = None
         self.vector_index = None
 
-    def process(self):
-        self.full_text = pymupdf4llm.to_markdown(self.file_path)
-        document = Document(text=self.full_text)
-        splitter = SentenceSplitter(chunk_size=1024)
-        self.nodes = splitter.get_nodes_from_documents([document])
-        self.summary_index = SummaryIndex(self.nodes)
-        self.vector_index = VectorStoreIndex(self.nodes)
-        
+    def process(self, build_indexes: bool = True):
+        import pymupdf4llm
+        from llama_index.core import SummaryIndex, VectorStoreIndex
+
+        get_model_backend()
+        with span("parse"):
+            self.full_text = pymupdf4llm.to_markdown(self.file_path)
+        self.nodes = split_into_nodes(self.full_text)
+        if not build_indexes:
+            return
+        with span("index_build"):
+            self.summary_index = SummaryIndex(self.nodes)
+            self.vector_index = VectorStoreIndex(self.nodes)
         
+def chunker_signature() -> str:
+    return f"sentence:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+
+# Documents stored before the signature was recorded used the original settings
+LEGACY_CHUNKER_SIGNATURE = "sentence:1024:200"
+
+def split_into_nodes(full_text: str):
+    from llama_index.core import Document
+    from llama_index.core.node_parser import SentenceSplitter
+
+    with span("chunk"):
+        splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        return splitter.get_nodes_from_documents([Document(text=full_text)])
+
+def summarize_nodes_for_tool(node_texts: List[str]) -> Optional[str]:
+    """Tool-selection summary of a document's first chunks, or None if it failed."""
+    try:
+        with span("tool_summary"):
+            return get_model_backend().summarize_for_tool("\n\n".join(node_texts[:4]))
+    except Exception as e:
+        logger.warning(f"Could not summarize document for tool selection: {e}")
+        return None
+
+def write_json_atomically(path: str, data: Any, **kwargs):
+    # Each writer gets its own temporary file, so concurrent writers of the
+    # same path cannot truncate each other's output before it is renamed
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_document_info(file_id: str, doc_info: Dict[str, Any]) -> int:
+    """Atomically write a document's info file; returns its new mtime."""
+    info_to_save = {k: v for k, v in doc_info.items() if k not in ['query_engine', 'info_mtime_ns']}
+    info_path = os.path.join(UPLOADS_DIR, f"{file_id}_info.json")
+    write_json_atomically(info_path, info_to_save, default=str)
+    return os.stat(info_path).st_mtime_ns
+
 class QueryEngineBuilder:
-    def __init__(self, summary_index: SummaryIndex, vector_index: VectorStoreIndex): #, kg_index: KnowledgeGraphIndex
+    def __init__(self, summary_index: "SummaryIndex", vector_index: "VectorStoreIndex"): #, kg_index: KnowledgeGraphIndex
         self.summary_index = summary_index
         self.vector_index = vector_index
         self.query_engine = None
 
     def build_query_engine(self):
+        from llama_index.core.query_engine.router_query_engine import RouterQueryEngine
+        from llama_index.core.selectors import LLMSingleSelector
+        from llama_index.core.tools import QueryEngineTool
+
         summary_query_engine = self.summary_index.as_query_engine(
             response_mode="tree_summarize",
             use_async=True,
@@ -205,19 +1074,21 @@ class QueryEngineBuilder:
         self.query_engine = RouterQueryEngine(
             selector=LLMSingleSelector.from_defaults(),
             query_engine_tools=[summary_tool, vector_tool], #, kg_tool
-            verbose=True
+            verbose=VERBOSE
         )
 
 
 document_store = {}
 
-async def process_document(file_path: str, file_hash: str, original_filename: str):
+def process_document(file_path: str, file_hash: str, original_filename: str):
     try:
         file_stat = os.stat(file_path)
         file_size = file_stat.st_size
         last_modified = datetime.datetime.fromtimestamp(file_stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
         created_at = datetime.datetime.fromtimestamp(file_stat.st_ctime).strftime("%Y-%m-%d %H:%M:%S")
         
+        import fitz
+
         doc = fitz.open(file_path)
         page_count = len(doc)
         
@@ -227,14 +1098,18 @@ async def process_document(file_path: str, file_hash: str, original_filename: st
         
         doc.close()
 
+        # The ingestion worker embeds shared-mode documents once, when it publishes them
         processor = DocumentProcessor(file_path)
-        processor.process()
+        processor.process(build_indexes=not SHARED_STATE_DIR)
         
-        query_engine_builder = QueryEngineBuilder(processor.summary_index, processor.vector_index) #, processor.kg_index
-        query_engine_builder.build_query_engine()
+        query_engine = None
+        if not SHARED_STATE_DIR:
+            query_engine_builder = QueryEngineBuilder(processor.summary_index, processor.vector_index) #, processor.kg_index
+            query_engine_builder.build_query_engine()
+            query_engine = query_engine_builder.query_engine
         
         doc_info = {
-            "query_engine": query_engine_builder.query_engine,
+            "query_engine": query_engine,
             "full_text": processor.full_text,
             "nodes": [node.to_dict() for node in processor.nodes],  # Convert nodes to dict
             "filename": original_filename,
@@ -243,14 +1118,19 @@ async def process_document(file_path: str, file_hash: str, original_filename: st
             "last_modified": last_modified,
             "created_at": created_at,
             "page_count": page_count,
-            "author": author
+            "author": author,
+            "chunker": chunker_signature(),
         }
+        # Computed once here so that building the agents never calls the LLM
+        tool_summary = summarize_nodes_for_tool([node.text for node in processor.nodes])
+        if tool_summary is not None:
+            doc_info["tool_summary"] = tool_summary
         
+        if not os.path.exists(file_path):
+            logger.info(f"Document {file_hash} was deleted while it was being processed")
+            return
+        doc_info["info_mtime_ns"] = write_document_info(file_hash, doc_info)
         document_store[file_hash] = doc_info
-        info_to_save = {k: v for k, v in doc_info.items() if k not in ['query_engine']}
-        info_path = os.path.join(UPLOADS_DIR, f"{file_hash}_info.json")
-        with open(info_path, "w") as f:
-            json.dump(info_to_save, f, default=str)
 
     except Exception as e:
         logger.error(f"Error processing document: {e}")
@@ -265,40 +1145,660 @@ def get_available_documents():
             documents[file_id] = doc_info
     return documents
 
-import openai
-def summarize_for_tool(summary_content):
+def shared_path(*parts: str) -> str:
+    return os.path.join(SHARED_STATE_DIR, *parts)
+
+class CorpusSnapshot:
+    """One published corpus version, memory-mapped read-only.
+
+    embeddings.npy holds unit-length node embeddings (one row per node),
+    texts.bin the node texts back to back with offsets.npy as byte offsets,
+    node_ids.bin and node_id_offsets.npy the node ids the same way, tools.npy
+    the embedding of each document's agent tool description, and meta.json
+    the row ranges, filename and tool summary of each document. Workers map
+    the same files, so the page cache holds a single copy; only meta.json,
+    which has one entry per document rather than per node, is parsed.
     """
-    Generates a compact summary of the provided content using LLM's API.
 
-    Parameters:
-        api_key (str): Your LLM API key.
-        summary_content (str): The content to summarize.
+    def __init__(self, name: str):
+        import numpy as np
+
+        self.name = name
+        path = shared_path("versions", name)
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.version: int = self.meta["version"]
+        self.documents: Dict[str, Dict[str, Any]] = self.meta["documents"]
+        self.embeddings = self._load(os.path.join(path, "embeddings.npy"))
+        self.offsets = self._load(os.path.join(path, "offsets.npy"))
+        self.tools = self._load(os.path.join(path, "tools.npy"))
+        self._tool_owners = sorted(self.documents, key=lambda file_id: self.documents[file_id]["tool_row"])
+        # Per-document nodes and summary indexes, built once per version on first use
+        self._nodes: Dict[str, list] = {}
+        self._summary_indexes: Dict[str, "SummaryIndex"] = {}
+        self._texts = self._load_bytes(os.path.join(path, "texts.bin"))
+        self._node_ids = self._load_bytes(os.path.join(path, "node_ids.bin"))
+        self.node_id_offsets = self._load(os.path.join(path, "node_id_offsets.npy"))
+        self._starts = sorted((doc["start"], file_id) for file_id, doc in self.documents.items())
+
+    @staticmethod
+    def _load(path: str):
+        import numpy as np
+        try:
+            return np.load(path, mmap_mode="r")
+        except ValueError:
+            # numpy cannot map an array without data
+            return np.load(path)
+
+    @staticmethod
+    def _load_bytes(path: str):
+        import numpy as np
+        return np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else b""
+
+    @property
+    def rows(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw_text(self, row: int) -> bytes:
+        return bytes(self._texts[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+    def text(self, row: int) -> str:
+        return self.raw_text(row).decode("utf-8")
+
+    def raw_node_id(self, row: int) -> bytes:
+        return bytes(self._node_ids[int(self.node_id_offsets[row]):int(self.node_id_offsets[row + 1])])
+
+    def node_id(self, row: int) -> str:
+        return self.raw_node_id(row).decode("utf-8")
+
+    def file_id_for_row(self, row: int) -> Optional[str]:
+        import bisect
+        index = bisect.bisect_right(self._starts, (row, "￿")) - 1
+        return self._starts[index][1] if index >= 0 else None
+
+    def nodes(self, file_id: str) -> list:
+        if file_id not in self._nodes:
+            from llama_index.core.schema import TextNode
+
+            doc = self.documents[file_id]
+            self._nodes[file_id] = [
+                TextNode(id_=self.node_id(row), text=self.text(row)) for row in range(doc["start"], doc["stop"])
+            ]
+        return self._nodes[file_id]
+
+    def summary_index(self, file_id: str) -> "SummaryIndex":
+        if file_id not in self._summary_indexes:
+            from llama_index.core import SummaryIndex
+
+            self._summary_indexes[file_id] = SummaryIndex(self.nodes(file_id))
+        return self._summary_indexes[file_id]
+
+    @staticmethod
+    def _rank(matrix, query_embedding: List[float], top_k: int) -> List[Tuple[int, float]]:
+        import numpy as np
+
+        if len(matrix) == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = matrix @ query
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search(self, query_embedding: List[float], top_k: int, file_id: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Rows most similar to the query by cosine similarity, best first."""
+        start, stop = (self.documents[file_id]["start"], self.documents[file_id]["stop"]) if file_id else (0, self.rows)
+        if stop <= start:
+            return []
+        return [(start + i, score) for i, score in self._rank(self.embeddings[start:stop], query_embedding, top_k)]
+
+    def search_tools(self, query_embedding: List[float], top_k: int) -> List[Tuple[str, float]]:
+        """Documents whose tool description is most similar to the query, best first."""
+        return [(self._tool_owners[i], score) for i, score in self._rank(self.tools, query_embedding, top_k)]
+
+_corpus: Optional[CorpusSnapshot] = None
+_corpus_checked_at = 0.0
+
+def get_corpus(refresh: bool = False) -> Optional[CorpusSnapshot]:
+    """The newest published corpus version, or None outside shared mode.
+
+    The CURRENT pointer is re-read at most every CORPUS_POLL_INTERVAL seconds.
+    Switching versions only rebinds a module global, so readers never lock;
+    a request keeps using the snapshot it started with.
+    """
+    global _corpus, _corpus_checked_at
+    if not SHARED_STATE_DIR:
+        return None
+    now = time.monotonic()
+    if not refresh and _corpus is not None and now - _corpus_checked_at < CORPUS_POLL_INTERVAL:
+        return _corpus
+    _corpus_checked_at = now
+    try:
+        with open(shared_path("CURRENT")) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return _corpus
+    if _corpus is None or _corpus.name != name:
+        with span("corpus_load"):
+            _corpus = CorpusSnapshot(name)
+        logger.info(f"Serving corpus version {_corpus.version} ({len(_corpus.documents)} documents, {_corpus.rows} nodes)")
+    return _corpus
+
+@lru_cache(maxsize=None)
+def shared_retriever_class():
+    from llama_index.core import Settings
+    from llama_index.core.retrievers import BaseRetriever
+    from llama_index.core.schema import NodeWithScore, TextNode
+
+    class SharedVectorRetriever(BaseRetriever):
+        """Vector retrieval over a CorpusSnapshot, without building a per-worker index."""
+
+        def __init__(self, corpus: CorpusSnapshot, file_id: Optional[str] = None, similarity_top_k: int = 2):
+            super().__init__()
+            self._corpus = corpus
+            self._file_id = file_id
+            self._similarity_top_k = similarity_top_k
+
+        def _retrieve(self, query_bundle):
+            query_embedding = query_bundle.embedding or Settings.embed_model.get_query_embedding(query_bundle.query_str)
+            results = []
+            for row, score in self._corpus.search(query_embedding, self._similarity_top_k, self._file_id):
+                file_id = self._file_id or self._corpus.file_id_for_row(row)
+                node = TextNode(
+                    id_=self._corpus.node_id(row),
+                    text=self._corpus.text(row),
+                    metadata={"file_id": file_id, "filename": self._corpus.documents[file_id]["filename"]},
+                )
+                results.append(NodeWithScore(node=node, score=score))
+            return results
+
+    return SharedVectorRetriever
+
+def shared_query_engine(corpus: CorpusSnapshot, file_id: str, llm, similarity_top_k: int = 2):
+    from llama_index.core.query_engine import RetrieverQueryEngine
+
+    retriever = shared_retriever_class()(corpus, file_id, similarity_top_k)
+    return RetrieverQueryEngine.from_args(retriever, llm=llm)
+
+@lru_cache(maxsize=None)
+def shared_tool_retriever_class():
+    from llama_index.core import Settings
+    from llama_index.core.retrievers import BaseRetriever
+    from llama_index.core.schema import NodeWithScore, TextNode
+
+    class SharedToolRetriever(BaseRetriever):
+        """Ranks the per-document agent tools by the description embeddings stored in a CorpusSnapshot."""
+
+        def __init__(self, corpus: CorpusSnapshot, similarity_top_k: int):
+            super().__init__()
+            self._corpus = corpus
+            self._similarity_top_k = similarity_top_k
+
+        def _retrieve(self, query_bundle):
+            query_embedding = query_bundle.embedding or Settings.embed_model.get_query_embedding(query_bundle.query_str)
+            results = []
+            for file_id, score in self._corpus.search_tools(query_embedding, self._similarity_top_k):
+                doc = self._corpus.documents[file_id]
+                name, description = document_tool_metadata(doc["filename"][:-4], doc["tool_summary"])
+                node = TextNode(text=tool_node_text(name, description), metadata={"name": name})
+                results.append(NodeWithScore(node=node, score=score))
+            return results
+
+    return SharedToolRetriever
+
+def shared_tool_retriever(corpus: CorpusSnapshot, tools, similarity_top_k: int):
+    from llama_index.core.objects import ObjectRetriever, SimpleToolNodeMapping
+
+    retriever = shared_tool_retriever_class()(corpus, similarity_top_k)
+    return ObjectRetriever(retriever, SimpleToolNodeMapping.from_objects(tools))
+
+def document_tool_metadata(doc_name: str, tool_summary: str) -> Tuple[str, str]:
+    """Name and description of the tool that hands questions to a document's agent."""
+    name = f"tool_{re.sub(r'[^a-zA-Z0-9_-]', '_', doc_name)}"
+    description = (
+        f"This content contains cybersecurity audits about {doc_name}. Use"
+        f" this tool if you want to answer any questions about {tool_summary}.\n"
+    )
+    return name, description
 
-    Returns:
-        str: A concise summary of the content, limited to 100 words.
+def tool_node_text(name: str, description: str) -> str:
+    # What ObjectIndex embeds for a tool
+    return f"Tool name: {name}\nTool description: {description}\n"
+
+def stored_document_ids() -> List[str]:
+    return [filename[:-10] for filename in os.listdir(UPLOADS_DIR) if filename.endswith("_info.json")]
+
+def stored_document_mtimes() -> Dict[str, int]:
+    return {
+        entry.name[:-10]: entry.stat().st_mtime_ns
+        for entry in os.scandir(UPLOADS_DIR) if entry.name.endswith("_info.json")
+    }
+
+def embedding_signature(embed_model) -> str:
+    return f"{embed_model.class_name()}:{embed_model.model_name}"
+
+def enqueue_upload(file_path: str, file_hash: str, original_filename: str, replaces: Optional[str] = None):
+    """Hand an upload to the ingestion worker."""
+    entry_path = shared_path("queue", f"{file_hash}.json")
+    write_json_atomically(entry_path, {"file_path": file_path, "file_hash": file_hash, "filename": original_filename, "replaces": replaces})
+
+def ingest_queued_uploads():
+    queue_dir = shared_path("queue")
+    for entry in sorted(os.listdir(queue_dir)):
+        if not entry.endswith(".json"):
+            continue
+        entry_path = os.path.join(queue_dir, entry)
+        try:
+            with open(entry_path) as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            # Deleted before it was processed
+            continue
+        if job.get("replaces"):
+            process_replacement(job["file_path"], job["file_hash"], job["filename"], job["replaces"])
+        elif not os.path.exists(os.path.join(UPLOADS_DIR, f"{job['file_hash']}_info.json")):
+            process_document(job["file_path"], job["file_hash"], job["filename"])
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
+
+# file_id -> (info mtime, failed attempts, monotonic time of the next attempt)
+_publish_failures: Dict[str, Tuple[int, int, float]] = {}
+
+def embed_document(backend, node_texts: List[str], tool_text: str):
+    """Unit-length embeddings of a document's nodes and of its tool description."""
+    import numpy as np
+
+    with span("embed"):
+        vectors = np.asarray(backend.embed_model.get_text_embedding_batch(node_texts + [tool_text]), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors[:-1], vectors[-1]
+
+def write_packed(directory: str, data_name: str, offsets_name: str, chunks: List[bytes]):
+    """Write byte strings back to back, with their byte offsets in a separate array."""
+    import numpy as np
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks], dtype=np.int64)
+    np.save(os.path.join(directory, offsets_name), offsets)
+    with open(os.path.join(directory, data_name), "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+def publish_corpus() -> Optional[CorpusSnapshot]:
+    """Publish a new corpus version if the processed documents changed.
+
+    Only the ingestion worker calls this. Documents that are unchanged since
+    the current version keep their rows, which are copied without being
+    embedded again; deleted documents are left out, which compacts the
+    matrix. New documents, re-chunked documents and documents embedded with
+    another model are embedded. A document that cannot be embedded or
+    summarized is retried with exponential backoff and keeps its previous
+    rows meanwhile; the other documents are published without it. The
+    version is written to a temporary directory, renamed into place and then
+    made current by atomically replacing the CURRENT pointer.
     """
-    prompt = f"Please summarize the following content in no more than 100 words for easy tool selection:\n\n{summary_content}"
+    import numpy as np
+
+    current = get_corpus(refresh=True)
+    known = current.documents if current is not None else {}
+    stored = stored_document_mtimes()
+    for file_id, (mtime, _, _) in list(_publish_failures.items()):
+        if stored.get(file_id) != mtime:
+            # Changed or deleted since it failed
+            del _publish_failures[file_id]
+    if not stored and not known:
+        return current
+
+    backend = get_model_backend() if stored else None
+    signature = embedding_signature(backend.embed_model) if stored else None
+    usable = {file_id for file_id, doc in known.items() if file_id in stored and doc.get("embedding") == signature}
+    kept = [file_id for file_id in usable if stored[file_id] == known[file_id].get("info_mtime_ns")]
+    now = time.monotonic()
+    due = [
+        file_id for file_id in stored
+        if file_id not in kept and (file_id not in _publish_failures or _publish_failures[file_id][2] <= now)
+    ]
+    if not due and len(usable) == len(known):
+        return current
+
+    documents = {}
+    node_ids = []
+    blocks = []
+    texts = []
+    tools = []
+
+    def add(file_id, doc, vectors, node_texts, ids, tool_vector):
+        # node_texts and ids are UTF-8 encoded
+        documents[file_id] = dict(doc, start=len(node_ids), stop=len(node_ids) + len(ids), tool_row=len(tools))
+        node_ids.extend(ids)
+        if len(ids):
+            blocks.append(vectors)
+        texts.extend(node_texts)
+        tools.append(tool_vector)
+
+    def add_previous(file_id):
+        doc = known[file_id]
+        rows = range(doc["start"], doc["stop"])
+        add(file_id, doc, np.asarray(current.embeddings[doc["start"]:doc["stop"]]),
+            [current.raw_text(row) for row in rows], [current.raw_node_id(row) for row in rows],
+            np.asarray(current.tools[doc["tool_row"]]))
+
+    for file_id in kept:
+        add_previous(file_id)
+
+    embedded = 0
+    failed = 0
+    for file_id in due:
+        previous = known.get(file_id)
+        try:
+            with open(os.path.join(UPLOADS_DIR, f"{file_id}_info.json")) as f:
+                doc_info = json.load(f)
+            node_texts = [node.get("text", "") for node in doc_info.get("nodes", [])]
+            if doc_info.get("tool_summary") is not None:
+                summary = doc_info["tool_summary"]
+            elif previous is not None and previous.get("info_mtime_ns") == stored[file_id]:
+                # Only the embedding model changed; the chunks the summary came from did not
+                summary = previous["tool_summary"]
+            else:
+                with span("tool_summary"):
+                    summary = backend.summarize_for_tool("\n\n".join(node_texts[:4]))
+            tool_text = tool_node_text(*document_tool_metadata(doc_info["filename"][:-4], summary))
+            vectors, tool_vector = embed_document(backend, node_texts, tool_text)
+        except FileNotFoundError:
+            # Deleted since it was listed
+            continue
+        except Exception as e:
+            _, attempts, _ = _publish_failures.get(file_id, (None, 0, 0.0))
+            attempts += 1
+            delay = min(PUBLISH_RETRY_SECONDS * 2 ** (attempts - 1), 3600)
+            _publish_failures[file_id] = (stored[file_id], attempts, time.monotonic() + delay)
+            metrics.inc("cyberstrike_corpus_document_failures_total")
+            logger.error(f"Could not publish document {file_id} (attempt {attempts}, retrying in {delay:.0f}s): {e}")
+            failed += 1
+            continue
+        _publish_failures.pop(file_id, None)
+        doc = {
+            "filename": doc_info["filename"],
+            "tool_summary": summary,
+            "info_mtime_ns": stored[file_id],
+            "embedding": signature,
+        }
+        ids = [node.get("id_", f"{file_id}-{i}").encode("utf-8") for i, node in enumerate(doc_info.get("nodes", []))]
+        add(file_id, doc, vectors, [text.encode("utf-8") for text in node_texts], ids, tool_vector)
+        embedded += 1
+
+    stale = 0
+    for file_id in stored:
+        if file_id in usable and file_id not in documents and file_id in _publish_failures:
+            # Failed or backing off; serve the rows it had until it succeeds
+            add_previous(file_id)
+            stale += 1
+    removed = len(set(known) - set(documents))
+    if not embedded and not removed:
+        return current
+
+    version = current.version + 1 if current is not None else 1
+    name = f"v{version:06d}"
+    versions_dir = shared_path("versions")
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=versions_dir)
+    embeddings = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    np.save(os.path.join(staging, "embeddings.npy"), embeddings)
+    np.save(os.path.join(staging, "tools.npy"), np.stack(tools) if tools else np.zeros((0, 0), dtype=np.float32))
+    write_packed(staging, "texts.bin", "offsets.npy", texts)
+    write_packed(staging, "node_ids.bin", "node_id_offsets.npy", node_ids)
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump({"version": version, "documents": documents}, f)
+    os.rename(staging, os.path.join(versions_dir, name))
+
+    with open(shared_path("CURRENT.tmp"), "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(shared_path("CURRENT.tmp"), shared_path("CURRENT"))
+    logger.info(
+        f"Published corpus version {version}: {embedded} documents embedded, {len(kept)} kept,"
+        f" {removed} removed, {failed} failed ({stale} served from the previous version)"
+    )
 
+    for old in sorted(v for v in os.listdir(versions_dir) if v.startswith("v"))[:-CORPUS_VERSIONS_KEPT]:
+        # Workers still mapping an old version keep their pages until they unmap
+        shutil.rmtree(os.path.join(versions_dir, old), ignore_errors=True)
+    return get_corpus(refresh=True)
+
+_ingest_lock_file = None
+
+def try_become_ingester() -> bool:
+    """Take the ingestion lock if no other worker holds it."""
+    import fcntl
+
+    global _ingest_lock_file
+    if _ingest_lock_file is not None:
+        return True
+    lock_file = open(shared_path("ingest.lock"), "a")
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant for summarizing content."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150, 
-            temperature=0.1
-        )
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _ingest_lock_file = lock_file
+    logger.info(f"Worker {os.getpid()} is the corpus ingestion worker")
+    return True
+
+def corpus_ingest_loop():
+    # Every worker runs this loop; only the lock holder ingests and maintains
+    # the corpus, and another worker takes over if it exits.
+    next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+    while True:
+        try:
+            if try_become_ingester():
+                ingest_queued_uploads()
+                if time.monotonic() >= next_maintenance:
+                    run_maintenance()
+                    next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+                publish_corpus()
+        except Exception as e:
+            logger.error(f"Error publishing corpus: {e}")
+        time.sleep(CORPUS_POLL_INTERVAL)
+
+def delete_document(file_id: str):
+    """Remove a document, its derived results and its cache entry.
+
+    The info file goes first, so the document drops out of listings (and, in
+    shared mode, out of the next corpus version) straight away. Results that
+    a request still in flight writes afterwards are removed by the next
+    garbage collection pass.
+    """
+    for suffix in ("_info.json", ".pdf", *DERIVED_SUFFIXES):
+        try:
+            os.remove(os.path.join(UPLOADS_DIR, f"{file_id}{suffix}"))
+        except FileNotFoundError:
+            pass
+    if SHARED_STATE_DIR:
+        try:
+            os.remove(shared_path("queue", f"{file_id}.json"))
+        except FileNotFoundError:
+            pass
+    document_store.pop(file_id, None)
+    _document_indexes.pop(file_id, None)
+    metrics.inc("cyberstrike_documents_deleted_total")
+    logger.info(f"Deleted document {file_id}")
+
+def process_replacement(file_path: str, file_hash: str, original_filename: str, replaces: str):
+    process_document(file_path, file_hash, original_filename)
+    if os.path.exists(os.path.join(UPLOADS_DIR, f"{file_hash}_info.json")):
+        delete_document(replaces)
+    else:
+        logger.warning(f"Keeping {replaces}: its replacement {file_hash} could not be processed")
 
-        summary = response['choices'][0]['message']['content'].strip()
-        return summary
+_chunker_checked: Dict[str, int] = {}
+
+def reindex_stale_documents() -> int:
+    """Re-chunk documents stored with chunker settings other than the current ones.
+
+    Nodes are rebuilt from the stored full text, so the PDF is not parsed
+    again. Documents stored without a tool summary get one. Info files
+    already checked at their current mtime are skipped without being read.
+    """
+    signature = chunker_signature()
+    reindexed = 0
+    for file_id, mtime in stored_document_mtimes().items():
+        if _chunker_checked.get(file_id) == mtime:
+            continue
+        try:
+            with open(os.path.join(UPLOADS_DIR, f"{file_id}_info.json")) as f:
+                doc_info = json.load(f)
+            changed = False
+            if doc_info.get("chunker", LEGACY_CHUNKER_SIGNATURE) != signature:
+                doc_info["nodes"] = [node.to_dict() for node in split_into_nodes(doc_info["full_text"])]
+                doc_info["chunker"] = signature
+                changed = True
+                metrics.inc("cyberstrike_documents_reindexed_total")
+                reindexed += 1
+            if doc_info.get("tool_summary") is None:
+                tool_summary = summarize_nodes_for_tool([node.get("text", "") for node in doc_info.get("nodes", [])])
+                if tool_summary is not None:
+                    doc_info["tool_summary"] = tool_summary
+                    changed = True
+            if changed:
+                mtime = write_document_info(file_id, doc_info)
+                document_store.pop(file_id, None)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            # Skipped until the file is rewritten, so the rest of the pass still runs
+            logger.error(f"Could not reindex document {file_id}: {e}")
+            _chunker_checked[file_id] = mtime
+            continue
+        if doc_info.get("tool_summary") is not None:
+            # Documents whose summary failed are looked at again next pass
+            _chunker_checked[file_id] = mtime
+    return reindexed
+
+def collect_garbage() -> int:
+    """Reclaim disk and memory held for documents that no longer exist.
+
+    Removes derived results of deleted documents; uploads that were never
+    processed, leftover temporary files and abandoned corpus staging
+    directories once they are ORPHAN_GRACE_SECONDS old; and cache entries
+    whose info file was deleted or rewritten.
+    """
+    documents = set(stored_document_ids())
+    queued = set()
+    if SHARED_STATE_DIR:
+        queued = {entry[:-5] for entry in os.listdir(shared_path("queue")) if entry.endswith(".json")}
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    removed = 0
+
+    def remove(path, kind):
+        nonlocal removed
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        removed += 1
+        metrics.inc("cyberstrike_gc_files_removed_total", kind=kind)
+
+    with os.scandir(UPLOADS_DIR) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.endswith(DERIVED_SUFFIXES):
+                if name[:name.index("_")] not in documents:
+                    remove(entry.path, "derived")
+            elif name.endswith(".pdf"):
+                # Give uploads that are still being processed time to finish
+                if name[:-4] not in documents and name[:-4] not in queued and entry.stat().st_mtime < cutoff:
+                    remove(entry.path, "upload")
+            elif name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                remove(entry.path, "temporary")
+
+    if SHARED_STATE_DIR:
+        versions_dir = shared_path("versions")
+        for name in os.listdir(versions_dir):
+            path = os.path.join(versions_dir, name)
+            if name.startswith(".staging-") and os.stat(path).st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                metrics.inc("cyberstrike_gc_files_removed_total", kind="staging")
+
+    for file_id, doc_info in list(document_store.items()):
+        if doc_info.get("info_mtime_ns") != info_mtime(file_id):
+            document_store.pop(file_id, None)
+    for file_id, (mtime, *_) in list(_document_indexes.items()):
+        if mtime != info_mtime(file_id):
+            _document_indexes.pop(file_id, None)
+    for file_id in set(_chunker_checked) - documents:
+        del _chunker_checked[file_id]
+    return removed
+
+def run_maintenance():
+    start = time.perf_counter()
+    try:
+        reindexed = reindex_stale_documents()
+        removed = collect_garbage()
+        if reindexed or removed:
+            logger.info(f"Maintenance re-chunked {reindexed} documents and removed {removed} files")
+    finally:
+        record_span("maintenance", time.perf_counter() - start)
+
+def maintenance_loop():
+    # The first pass waits one interval, so starting a worker does not read
+    # every stored document
+    while True:
+        time.sleep(MAINTENANCE_INTERVAL)
+        try:
+            run_maintenance()
+        except Exception as e:
+            logger.error(f"Error during maintenance: {e}")
+
+# Indexes of the default mode, reused across requests: per document while its
+# info file is unchanged, and for the tool descriptions while they are unchanged.
+# Agents keep chat memory, so they are still built per request.
+_document_indexes: Dict[str, Tuple[int, list, "VectorStoreIndex", "SummaryIndex"]] = {}
+_tool_index: Optional[Tuple[Tuple[str, ...], "VectorStoreIndex"]] = None
+
+def document_indexes(file_id: str, doc_info: Dict[str, Any]) -> Tuple[list, "VectorStoreIndex", "SummaryIndex"]:
+    """Nodes, vector index and summary index of a stored document."""
+    from llama_index.core import Document, SummaryIndex, VectorStoreIndex
+
+    cached = _document_indexes.get(file_id)
+    if cached is not None and cached[0] == doc_info["info_mtime_ns"]:
+        record_cache("document_indexes", True)
+        return cached[1:]
+    record_cache("document_indexes", False)
+    nodes = [Document.from_dict(node) for node in doc_info['nodes']]
+    with span("index_build"):
+        vector_index = VectorStoreIndex(nodes)
+        summary_index = SummaryIndex(nodes)
+    _document_indexes[file_id] = (doc_info["info_mtime_ns"], nodes, vector_index, summary_index)
+    return nodes, vector_index, summary_index
+
+def default_tool_retriever(tools, similarity_top_k: int):
+    """Retriever over this request's document tools, by the cached description embeddings."""
+    global _tool_index
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.objects import ObjectRetriever, SimpleToolNodeMapping
+
+    mapping = SimpleToolNodeMapping.from_objects(tools)
+    # The nodes ObjectIndex would embed
+    nodes = [mapping.to_node(tool) for tool in tools]
+    key = tuple(node.get_content() for node in nodes)
+    index = _tool_index
+    record_cache("tool_index", index is not None and index[0] == key)
+    if index is None or index[0] != key:
+        with span("index_build"):
+            index = _tool_index = (key, VectorStoreIndex(nodes))
+    return ObjectRetriever(index[1].as_retriever(similarity_top_k=similarity_top_k), mapping)
 
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
-    
-        
 def process_nodes():
-    available_documents = get_available_documents()    
+    from llama_index.core.tools import QueryEngineTool, ToolMetadata
+
+    model_backend = get_model_backend()
+    corpus = get_corpus()
+    available_documents = corpus.documents if corpus is not None else get_available_documents()    
     if not available_documents:
         return {"response": "No documents are currently available in the system. Please upload some documents first."}
 
@@ -307,35 +1807,40 @@ def process_nodes():
     summary_index = {}
     summary_to_identify = {}
     agents = {}
-    query_engines = {}
     all_nodes = []
        
     titles = [doc_info["filename"] for doc_info in available_documents.values()]
       
     for doc_name in titles:
         file_id = next(id for id, info in available_documents.items() if info["filename"] == doc_name)
-        doc_info = get_document_info(file_id)
-         
-        if 'full_text' not in doc_info or 'nodes' not in doc_info:
-            logger.warning(f"Full text or nodes not found for document {doc_name}. Skipping...")
-            continue
-            
-        document = Document(text=doc_info['full_text'])
-        nodes = [Document.from_dict(node) for node in doc_info['nodes']]
-            
-        doc_name = doc_name[:-4]  # Remove .pdf extension
-        docs_list[doc_name] = DocumentProcessor(os.path.join(UPLOADS_DIR, f"{file_id}.pdf"))
-        docs_list[doc_name].full_text = doc_info['full_text']
-        docs_list[doc_name].nodes = nodes
-        all_nodes.extend(nodes)
-            
-        vector_index[doc_name] = VectorStoreIndex(nodes)
-        summary_index[doc_name] = SummaryIndex(nodes)
-        node_ids = [node_id for value in summary_index[doc_name].ref_doc_info.values() for node_id in value.node_ids[:4]]
-        summary_to_identify[doc_name] = summarize_for_tool(summary_index[doc_name].docstore.get_nodes(node_ids))
-            
-        vector_query_engine = vector_index[doc_name].as_query_engine(llm=gemini_llm)
-        summary_query_engine = summary_index[doc_name].as_query_engine(llm=gemini_llm)
+
+        if corpus is not None:
+            # Embeddings and tool summary were computed once, at publish time, and
+            # the snapshot keeps the nodes and summary index for as long as it is current
+            doc_name = doc_name[:-4]  # Remove .pdf extension
+            all_nodes.extend(corpus.nodes(file_id))
+            summary_index[doc_name] = corpus.summary_index(file_id)
+            summary_to_identify[doc_name] = corpus.documents[file_id]["tool_summary"]
+            vector_query_engine = shared_query_engine(corpus, file_id, model_backend.llm)
+        else:
+            doc_info = get_document_info(file_id)
+             
+            if 'full_text' not in doc_info or 'nodes' not in doc_info:
+                logger.warning(f"Full text or nodes not found for document {doc_name}. Skipping...")
+                continue
+                
+            doc_name = doc_name[:-4]  # Remove .pdf extension
+            nodes, vector_index[doc_name], summary_index[doc_name] = document_indexes(file_id, doc_info)
+            docs_list[doc_name] = DocumentProcessor(os.path.join(UPLOADS_DIR, f"{file_id}.pdf"))
+            docs_list[doc_name].full_text = doc_info['full_text']
+            docs_list[doc_name].nodes = nodes
+            all_nodes.extend(nodes)
+            # Summarized when the document was processed; the maintenance pass
+            # fills it in for documents stored before that
+            summary_to_identify[doc_name] = doc_info.get("tool_summary") or doc_name
+                
+            vector_query_engine = vector_index[doc_name].as_query_engine(llm=model_backend.llm)
+        summary_query_engine = summary_index[doc_name].as_query_engine(llm=model_backend.llm)
         query_engine_tools = [
                 QueryEngineTool(
                     query_engine=vector_query_engine,
@@ -359,11 +1864,10 @@ def process_nodes():
                     ),
                 ),
             ]   
-        function_llm = OpenAI(model="gpt-4o-mini")
-        agent = OpenAIAgent.from_tools(
+        function_llm = model_backend.function_llm()
+        agent = model_backend.build_agent(
                 query_engine_tools,
                 llm=function_llm,
-                verbose=True,
                 system_prompt=f"""\
         You are a specialized agent designed to answer queries about {doc_name}.
         Choose this document based on {summary_to_identify[doc_name]}
@@ -371,34 +1875,31 @@ def process_nodes():
         """,
             )
         agents[doc_name] = agent
-        query_engines[doc_name] = vector_index[doc_name].as_query_engine(
-                similarity_top_k=3
-            )
         
     all_tools = []
     n=0
     for docs in titles:
         docs = docs[:-4]
         n +=1
-        summary = (
-                f"This content contains cybersecurity audits about {docs}. Use"
-                f" this tool if you want to answer any questions about {summary_to_identify[docs]}.\n"
-            )
+        name, summary = document_tool_metadata(docs, summary_to_identify[docs])
         doc_tool = QueryEngineTool(
                 query_engine=agents[docs],
                 metadata=ToolMetadata(
-                    name=f"tool_{re.sub(r'[^a-zA-Z0-9_-]', '_', docs)}",
+                    name=name,
                     description=summary,
                 ),
             )
         all_tools.append(doc_tool)
         
-    obj_index = ObjectIndex.from_objects(
-            all_tools,
-            index_cls=VectorStoreIndex,
-        )
-    top_agent = OpenAIAgent.from_tools(
-            tool_retriever=obj_index.as_retriever(similarity_top_k=n),
+    if corpus is not None:
+        # Tool descriptions were embedded at publish time
+        tool_retriever = shared_tool_retriever(corpus, all_tools, n)
+        tool_retriever_cat = shared_tool_retriever(corpus, all_tools, 4)
+    else:
+        tool_retriever = default_tool_retriever(all_tools, n)
+        tool_retriever_cat = default_tool_retriever(all_tools, 4)
+    top_agent = model_backend.build_agent(
+            tool_retriever=tool_retriever,
             system_prompt=""" 
                 You are Fischer, a knowledgeable and friendly AI assistant from the CyberStrike AI Audit Management Suite. 
                 Your primary role is to assist users in navigating cybersecurity audit processes, providing insights, and 
@@ -407,15 +1908,13 @@ def process_nodes():
 
                 Please always use the tools provided to answer a question. Do not rely on prior knowledge.
         """,
-            verbose=True,
         )  
-    top_agent_cat = OpenAIAgent.from_tools(
-        tool_retriever=obj_index.as_retriever(similarity_top_k=4),
+    top_agent_cat = model_backend.build_agent(
+        tool_retriever=tool_retriever_cat,
         system_prompt=""" 
             You are an agent designed to answer queries about a set of given cyber security audits of different types.
             Please always use the tools provided to answer a question. Do not rely on prior knowledge.
     """,
-        verbose=True,
     )
     return top_agent, all_nodes, top_agent_cat
 
@@ -423,13 +1922,13 @@ def process_nodes():
 async def chat(chat_request: ChatRequest):
     try:
         
-        top_agent,all_nodes,_=process_nodes()
-        base_index = VectorStoreIndex(all_nodes)
-        base_query_engine = base_index.as_query_engine(similarity_top_k=4)
+        with span("process_nodes"):
+            top_agent,all_nodes,_=process_nodes()
         
         conversation = "\n".join([f"{msg.role}: {msg.content}" for msg in chat_request.history])
         
-        response = top_agent.chat(f"""
+        with span("agent"):
+            response = top_agent.chat(f"""
         Given the following conversation history and the user's query, provide a response based on the content of the documents:
 
         Conversation history:
@@ -439,8 +1938,7 @@ async def chat(chat_request: ChatRequest):
 
         Respond to the user's query using information from the documents:
         """)
-        logger.info(f"LLM Response: {response}")
-        res = clean_llm_response(str(response))
+        logger.debug(f"LLM Response: {response}")
         return {"response": str(response)}
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
@@ -448,7 +1946,8 @@ async def chat(chat_request: ChatRequest):
     
 @app.post('/graph')
 async def get_vulnerabilities_graph():
-    top_agent, _, _ = process_nodes()
+    with span("process_nodes"):
+        top_agent, _, _ = process_nodes()
     prompt = """
     Analyze the following documents to infer a list of vulnerabilities based on cybersecurity guidelines such as OWASP and NIST.
 
@@ -473,18 +1972,22 @@ async def get_vulnerabilities_graph():
     Ensure that the JSON structure is strictly followed, with vulnerability names as keys and arrays of filenames as values.
     """
     
-    response = top_agent.chat(prompt)
+    with span("agent"):
+        response = top_agent.chat(prompt)
     
     try:
         response_str = str(response)
-        logger.info(f"LLM Response: {response_str}")
+        logger.debug(f"LLM Response: {response_str}")
         
-        # Try to extract JSON from the response
-        json_match = re.search(r'\{[\s\S]*\}', response_str)
-        if json_match:
-            json_str = json_match.group(0)
-            json_data = json.loads(json_str)
-        else:
+        try:
+            json_data, _ = parse_llm_json(response_str, "{")
+            if "vulnerabilities" not in json_data:
+                json_data = {"vulnerabilities": json_data}
+            json_data = VulnerabilityGraph.model_validate(json_data).model_dump()
+        except ValueError as e:
+            logger.warning(f"Graph response is not valid JSON, parsing it as text: {e}")
+            json_data = None
+        if json_data is None:
             # If no JSON found, parse the text response
             vulnerabilities = {}
             current_vuln = None
@@ -506,7 +2009,8 @@ async def get_vulnerabilities_graph():
 
 @app.post('/categories')
 async def get_categories(categories_request: CategoriesRequest):
-    _,_,top_agent_cat=process_nodes()
+    with span("process_nodes"):
+        _,_,top_agent_cat=process_nodes()
     file_list = ', '.join(categories_request.file_list)
     prompt = f"""
         Classify the following file names into one of these categories:
@@ -532,7 +2036,8 @@ async def get_categories(categories_request: CategoriesRequest):
 
         """
         
-    response = top_agent_cat.chat(prompt)
+    with span("agent"):
+        response = top_agent_cat.chat(prompt)
     pattern = r'(\d+\.\s*[\w\s]+):\s*(\[.*?\])'
     matches = re.findall(pattern, str(response))
 
@@ -556,6 +2061,9 @@ async def get_categories(categories_request: CategoriesRequest):
 
 @app.post("/fileinfo/{file_id}", response_model=FileInfoResponse)
 async def get_file_info(file_id: str):
+    return describe_file(file_id)
+
+def describe_file(file_id: str) -> FileInfoResponse:
     doc_info = get_document_info(file_id)
     if not doc_info:
         raise HTTPException(status_code=404, detail="File not found")
@@ -575,14 +2083,11 @@ async def get_file_info(file_id: str):
 
 
 
-@app.post("/keyfindings", response_model=KeyFindingsResponse)
-async def get_key_findings(id_request: IdRequest):
-    file_id = id_request.id
-    try:
-        doc_info = get_document_info(file_id)
-        full_text = doc_info["full_text"]
-        
-        prompt = """
+def extract_key_findings(file_id: str) -> Dict[str, Any]:
+    doc_info = get_document_info(file_id)
+    full_text = doc_info["full_text"]
+    
+    prompt = """
         Analyze the following cybersecurity report and provide key findings in JSON format. The response must adhere to a clear hierarchical structure, focusing on the following categories:
 
         Threat Landscape: Overview of emerging threats and attack vectors, along with their impact.
@@ -631,29 +2136,30 @@ async def get_key_findings(id_request: IdRequest):
         Provide a comprehensive analysis that a cybersecurity professional would find informative and actionable.
         IMPORTANT: Ensure that your response contains only the JSON object and no additional text.
         """
-        
-        response = gemini_llm.complete(prompt + "\n\nDocument content:\n" + full_text)
-        
-        if not response.text.strip():
-            raise ValueError("Empty response from LLM")
-        
-        cleaned_response = clean_llm_response(response.text)
-        
-        json_match = re.search(r'(\{[\s\S]*\})', cleaned_response)
-        if json_match:
-            json_str = json_match.group(1)
-            findings = json.loads(json_str)
-        else:
-            raise ValueError("No valid JSON found in the response")
+    
+    findings, complete = complete_json(prompt + "\n\nDocument content:\n" + full_text, "{")
+    findings = request_missing_key_findings(findings, complete, prompt, full_text)
+    try:
+        findings = KeyFindings.model_validate(findings).model_dump(by_alias=True)
+    except ValidationError as e:
+        # Returned, but not stored, so /batch does not serve it as a cached result
+        logger.warning(f"Returning incomplete key findings for {file_id}: {e}")
+        return findings
 
-        findings_path = os.path.join(UPLOADS_DIR, f"{file_id}_findings.json")
-        with open(findings_path, "w") as f:
-            json.dump(findings, f, indent=2)
-        
+    findings_path = os.path.join(UPLOADS_DIR, f"{file_id}_findings.json")
+    with open(findings_path, "w") as f:
+        json.dump(findings, f, indent=2)
+
+    return findings
+
+@app.post("/keyfindings", response_model=KeyFindingsResponse)
+async def get_key_findings(id_request: IdRequest):
+    file_id = id_request.id
+    try:
+        findings = await run_analysis(file_id, "keyfindings")
         return KeyFindingsResponse(findings=findings)
     except json.JSONDecodeError as e:
         logger.error(f"Error parsing LLM response: {str(e)}")
-        logger.error(f"Cleaned response: {cleaned_response}")
         raise HTTPException(status_code=500, detail="Error parsing key findings: Invalid JSON")
     except ValueError as e:
         logger.error(f"Error with LLM response: {str(e)}")
@@ -662,14 +2168,11 @@ async def get_key_findings(id_request: IdRequest):
         logger.error(f"Error extracting key findings: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error extracting key findings: {str(e)}")
 
-@app.post("/vulnerabilities", response_model=VulnerabilitiesResponse)
-async def get_vulnerabilities(id_request: IdRequest):
-    file_id = id_request.id
-    try:
-        doc_info = get_document_info(file_id)
-        full_text = doc_info["full_text"]
-        
-        prompt = """
+def extract_vulnerabilities(file_id: str) -> List[Dict[str, Any]]:
+    doc_info = get_document_info(file_id)
+    full_text = doc_info["full_text"]
+    
+    prompt = """
         Analyze the following document and extract a list of vulnerabilities. 
         For each vulnerability:
         1. Provide a brief description
@@ -690,36 +2193,33 @@ async def get_vulnerabilities(id_request: IdRequest):
         Sort the list by criticality score in descending order.
         Ensure that your response contains only the JSON array and no additional text.
         """
-        
-        response = gemini_llm.complete(prompt + "\n\nDocument content:\n" + full_text)
-        
-        if not response.text.strip():
-            raise ValueError("Empty response from LLM")
-        
-        cleaned_response = clean_llm_response(response.text)
-        
-        json_match = re.search(r'(\[[\s\S]*\])', cleaned_response)
-        if json_match:
-            json_str = json_match.group(1)
-            vulnerabilities = json.loads(json_str)
-        else:
-            json_objects = re.findall(r'(\{[\s\S]*?\})', cleaned_response)
-            if json_objects:
-                json_str = '[' + ','.join(json_objects) + ']'
-                vulnerabilities = json.loads(json_str)
-            else:
-                raise ValueError("No valid JSON found in the response")
-        
-        sorted_vulnerabilities = sorted(vulnerabilities, key=lambda x: x['criticality'], reverse=True)
-        
-        vulnerabilities_path = os.path.join(UPLOADS_DIR, f"{file_id}_vulnerabilities.json")
-        with open(vulnerabilities_path, "w") as f:
-            json.dump(sorted_vulnerabilities, f, indent=2)
-        
+    
+    items, complete = complete_json(prompt + "\n\nDocument content:\n" + full_text, "[")
+    vulnerabilities = valid_vulnerabilities(items)
+    if items and not vulnerabilities:
+        raise ValueError("No valid vulnerabilities found in the response")
+    vulnerabilities, complete = request_missing_vulnerabilities(vulnerabilities, complete, prompt, full_text)
+    
+    sorted_vulnerabilities = sorted(vulnerabilities, key=lambda x: x['criticality'], reverse=True)
+    if not complete:
+        # Returned, but not stored, so /batch does not serve it as a cached result
+        logger.warning(f"Returning a truncated vulnerability list for {file_id}")
+        return sorted_vulnerabilities
+    
+    vulnerabilities_path = os.path.join(UPLOADS_DIR, f"{file_id}_vulnerabilities.json")
+    with open(vulnerabilities_path, "w") as f:
+        json.dump(sorted_vulnerabilities, f, indent=2)
+
+    return sorted_vulnerabilities
+
+@app.post("/vulnerabilities", response_model=VulnerabilitiesResponse)
+async def get_vulnerabilities(id_request: IdRequest):
+    file_id = id_request.id
+    try:
+        sorted_vulnerabilities = await run_analysis(file_id, "vulnerabilities")
         return VulnerabilitiesResponse(vulnerabilities=sorted_vulnerabilities)
     except json.JSONDecodeError as e:
         logger.error(f"Error parsing LLM response: {str(e)}")
-        logger.error(f"Cleaned response: {cleaned_response}")
         raise HTTPException(status_code=500, detail="Error parsing vulnerabilities: Invalid JSON")
     except ValueError as e:
         logger.error(f"Error with LLM response: {str(e)}")
@@ -729,13 +2229,11 @@ async def get_vulnerabilities(id_request: IdRequest):
         raise HTTPException(status_code=500, detail=f"Error extracting vulnerabilities: {str(e)}")
 
 
-@app.post("/summarize", response_model=SummarizeResponse)
-async def summarize_document(summarize_request: SummarizeRequest):
-    try:
-        doc_info = get_document_info(summarize_request.id)
-        full_text = doc_info["full_text"]
-        
-        summarization_prompt = f"""
+def summarize_document_text(file_id: str) -> str:
+    doc_info = get_document_info(file_id)
+    full_text = doc_info["full_text"]
+    
+    summarization_prompt = f"""
         Please provide a comprehensive summary of the following document. 
         The summary should:
         1. Capture the main topics and key points discussed in the document
@@ -749,12 +2247,144 @@ async def summarize_document(summarize_request: SummarizeRequest):
         Summary:
         """
 
-        response = gemini_llm.complete(summarization_prompt)
-        return SummarizeResponse(summary=response.text)
+    response = get_model_backend().llm.complete(summarization_prompt)
+
+    summary_path = os.path.join(UPLOADS_DIR, f"{file_id}_summary.json")
+    with open(summary_path, "w") as f:
+        json.dump({"summary": response.text}, f, indent=2)
+
+    return response.text
+
+@app.post("/summarize", response_model=SummarizeResponse)
+async def summarize_document(summarize_request: SummarizeRequest):
+    try:
+        summary = await run_analysis(summarize_request.id, "summary")
+        return SummarizeResponse(summary=summary)
     except Exception as e:
         logger.error(f"Error summarizing document: {e}")
         raise HTTPException(status_code=500, detail=f"Error summarizing document: {str(e)}")
 
+# Analyses that may run at once, across all requests of this worker
+ANALYSIS_CONCURRENCY = int(os.environ.get("CYBERSTRIKE_ANALYSIS_CONCURRENCY", "4"))
+# Cap on analyses started per minute, to stay under provider rate limits; 0 disables it
+ANALYSIS_PER_MINUTE = float(os.environ.get("CYBERSTRIKE_ANALYSIS_PER_MINUTE", "0"))
+
+ANALYSES = {
+    "keyfindings": (extract_key_findings, "_findings.json"),
+    "vulnerabilities": (extract_vulnerabilities, "_vulnerabilities.json"),
+    "summary": (summarize_document_text, "_summary.json"),
+}
+
+class RateLimiter:
+    """Limits how many analyses run at once and how often new ones start.
+
+    Only used from the event loop, so start times need no lock.
+    """
+
+    def __init__(self, max_concurrent: int, per_minute: float = 0):
+        self.max_concurrent = max_concurrent
+        self.interval = 60 / per_minute if per_minute else 0.0
+        self._next_start = 0.0
+        self._semaphore = None
+        self._loop = None
+
+    @asynccontextmanager
+    async def slot(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        start = time.perf_counter()
+        async with self._semaphore:
+            if self.interval:
+                now = time.monotonic()
+                begin = max(now, self._next_start)
+                self._next_start = begin + self.interval
+                await asyncio.sleep(begin - now)
+            record_span("analysis_queue", time.perf_counter() - start)
+            yield
+
+analysis_limiter = RateLimiter(ANALYSIS_CONCURRENCY, ANALYSIS_PER_MINUTE)
+_analyses_in_flight: Dict[Tuple[str, str], "asyncio.Future"] = {}
+
+async def run_analysis(file_id: str, analysis: str):
+    """Run an LLM analysis of a document off the event loop.
+
+    Callers asking for an analysis that is already running share its result
+    instead of starting another completion.
+    """
+    key = (file_id, analysis)
+    task = _analyses_in_flight.get(key)
+    if task is not None:
+        metrics.inc("cyberstrike_analysis_deduplicated_total", analysis=analysis)
+    else:
+        async def run():
+            try:
+                async with analysis_limiter.slot():
+                    with span(f"analysis_{analysis}"):
+                        return await asyncio.to_thread(ANALYSES[analysis][0], file_id)
+            finally:
+                _analyses_in_flight.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        _analyses_in_flight[key] = task
+    # A caller that goes away must not cancel the analysis for the others
+    return await asyncio.shield(task)
+
+def load_cached_analysis(file_id: str, analysis: str):
+    path = os.path.join(UPLOADS_DIR, f"{file_id}{ANALYSES[analysis][1]}")
+    try:
+        with open(path) as f:
+            result = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return result["summary"] if analysis == "summary" else result
+
+async def batch_item(file_id: str, analysis: str) -> BatchResult:
+    # Ids become file names; anything else must not reach the disk or take a limiter slot
+    if not DOCUMENT_ID.fullmatch(file_id):
+        return BatchResult(id=file_id, analysis=analysis, status="error", error="Invalid document id")
+    if info_mtime(file_id) is None:
+        return BatchResult(id=file_id, analysis=analysis, status="error", error="Document not found")
+    try:
+        if analysis == "fileinfo":
+            # Reads the info file, which can be large; keep it off the event loop
+            info = await asyncio.to_thread(describe_file, file_id)
+            return BatchResult(id=file_id, analysis=analysis, status="ok", result=info.model_dump())
+        cached = await asyncio.to_thread(load_cached_analysis, file_id, analysis)
+        record_cache("analysis", cached is not None)
+        if cached is not None:
+            return BatchResult(id=file_id, analysis=analysis, status="ok", cached=True, result=cached)
+        result = await run_analysis(file_id, analysis)
+        return BatchResult(id=file_id, analysis=analysis, status="ok", result=result)
+    except HTTPException as e:
+        return BatchResult(id=file_id, analysis=analysis, status="error", error=e.detail)
+    except Exception as e:
+        logger.error(f"Error running {analysis} for {file_id}: {e}")
+        return BatchResult(id=file_id, analysis=analysis, status="error", error=str(e))
+
+@app.post("/batch", response_model=BatchResponse)
+async def batch_analyses(batch_request: BatchRequest):
+    """Run several analyses over several documents in one request.
+
+    Stored results are returned without calling the LLM; the rest run
+    concurrently under the shared analysis limiter. With "stream": true the
+    response is NDJSON, one BatchResult per line in completion order.
+    """
+    ids = list(dict.fromkeys(batch_request.ids))
+    analyses = list(dict.fromkeys(batch_request.analyses))
+    tasks = [asyncio.ensure_future(batch_item(file_id, analysis)) for file_id in ids for analysis in analyses]
+
+    if not batch_request.stream:
+        return BatchResponse(results=await asyncio.gather(*tasks))
+
+    async def results():
+        for next_result in asyncio.as_completed(tasks):
+            item = await next_result
+            yield item.model_dump_json() + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     html_content = """
@@ -791,10 +2421,51 @@ async def root():
     """
     return HTMLResponse(content=html_content)
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def warm_up():
+    """Load the models, the corpus and its indexes ahead of the first request."""
+    start = time.perf_counter()
+    try:
+        get_model_backend()
+        get_corpus()
+        for file_id in stored_document_ids():
+            get_document_info(file_id)
+        # Fills the index caches process_nodes reuses across requests
+        process_nodes()
+        logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        logger.error(f"Error during warm-up: {e}")
+    finally:
+        record_span("warmup", time.perf_counter() - start)
+
+@app.on_event("startup")
+async def start_warm_up():
+    if os.environ.get("CYBERSTRIKE_WARMUP", "").lower() in ("1", "true", "yes"):
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("startup")
+async def start_corpus_maintenance():
+    # In shared mode the ingestion worker also runs the maintenance pass
+    if SHARED_STATE_DIR:
+        threading.Thread(target=corpus_ingest_loop, name="corpus-ingest", daemon=True).start()
+    else:
+        threading.Thread(target=maintenance_loop, name="maintenance", daemon=True).start()
+
 @app.get("/health")
 async def health_check():
+    """Liveness check; never touches the models."""
+    status = {"status": "healthy", "models_loaded": _model_backend is not None}
+    if SHARED_STATE_DIR:
+        status["corpus_version"] = _corpus.version if _corpus is not None else None
+    return status
+
+@app.get("/health/deep")
+async def deep_health_check():
     try:
-        response = gemini_llm.complete("Say 'Gemini is working!'")
+        response = get_model_backend().llm.complete("Say 'Gemini is working!'")
         if "Gemini is working" in response.text:
             return {"status": "healthy", "llm": "Gemini"}
         else:
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# main creates its uploads directory at import time
+os.environ.setdefault("CYBERSTRIKE_UPLOADS_DIR", tempfile.mkdtemp(prefix="cyberstrike-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,153 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import main
+from benchmarks.bench_api import make_report_pdf
+from benchmarks.fakes import FakeBackend
+
+A = "a" * 32
+B = "b" * 32
+C = "c" * 32
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    for directory in (uploads, tmp_path / "shared" / "versions", tmp_path / "shared" / "queue"):
+        directory.mkdir(parents=True)
+    monkeypatch.setattr(main, "UPLOADS_DIR", str(uploads))
+    monkeypatch.setattr(main, "SHARED_STATE_DIR", str(tmp_path / "shared"))
+    for name, value in [("_corpus", None), ("_publish_failures", {}), ("document_store", {}),
+                        ("_document_indexes", {}), ("_chunker_checked", {})]:
+        monkeypatch.setattr(main, name, value)
+    backend = FakeBackend()
+    backend.configure()
+    monkeypatch.setattr(main, "_model_backend", backend)
+    return uploads
+
+
+def store(file_id, *texts):
+    main.write_document_info(file_id, {
+        "filename": f"{file_id[:4]}.pdf",
+        "full_text": "\n".join(texts),
+        "nodes": [{"id_": f"{file_id}-{i}", "text": text} for i, text in enumerate(texts)],
+        "chunker": main.chunker_signature(),
+        "tool_summary": f"summary of {file_id[:4]}",
+    })
+
+
+def count_embeddings(monkeypatch):
+    embedded = []
+    embed_document = main.embed_document
+
+    def counting(backend, node_texts, tool_text):
+        embedded.append(node_texts)
+        return embed_document(backend, node_texts, tool_text)
+
+    monkeypatch.setattr(main, "embed_document", counting)
+    return embedded
+
+
+def rows(corpus, file_id):
+    doc = corpus.documents[file_id]
+    return [(corpus.node_id(row), corpus.text(row)) for row in range(doc["start"], doc["stop"])]
+
+
+def test_publish_delete_republish(shared, monkeypatch):
+    store(A, "first node of a", "second node of a")
+    store(B, "only node of b – ünïcode")
+    embedded = count_embeddings(monkeypatch)
+
+    first = main.publish_corpus()
+    assert first.version == 1 and first.rows == 3 and len(embedded) == 2
+    assert rows(first, B) == [(f"{B}-0", "only node of b – ünïcode")]
+    assert first.tools.shape[0] == 2
+    assert main.publish_corpus().version == 1
+
+    b_embedding = np.array(first.embeddings[first.documents[B]["start"]])
+    main.delete_document(A)
+    second = main.publish_corpus()
+    assert second.version == 2 and set(second.documents) == {B}
+    # B's rows were copied into the compacted version, not embedded again
+    assert len(embedded) == 2 and second.rows == 1
+    assert rows(second, B) == [(f"{B}-0", "only node of b – ünïcode")]
+    assert np.array_equal(second.embeddings[0], b_embedding)
+    assert [file_id for file_id, _ in second.search_tools(b_embedding, 5)] == [B]
+
+    store(A, "a is back")
+    third = main.publish_corpus()
+    assert third.version == 3 and rows(third, A) == [(f"{A}-0", "a is back")] and len(embedded) == 3
+
+
+def test_failed_document_backs_off_without_blocking_the_rest(shared, monkeypatch):
+    store(A, "node of a")
+    with open(os.path.join(shared, f"{C}_info.json"), "w") as f:
+        f.write('{"filename": "c.pdf", "nod')
+
+    corpus = main.publish_corpus()
+    assert set(corpus.documents) == {A}
+    assert main._publish_failures[C][1] == 1
+    # Backing off: nothing to publish until the retry is due
+    assert main.publish_corpus().version == corpus.version
+
+    store(C, "node of c")
+    corpus = main.publish_corpus()
+    assert set(corpus.documents) == {A, C} and C not in main._publish_failures
+
+
+def test_failed_update_keeps_previous_rows(shared, monkeypatch):
+    store(A, "old text of a")
+    main.publish_corpus()
+    store(A, "new text of a")
+    store(B, "node of b")
+    embed_document = main.embed_document
+
+    def fail_for_a(backend, node_texts, tool_text):
+        if node_texts == ["new text of a"]:
+            raise RuntimeError("embedding service unavailable")
+        return embed_document(backend, node_texts, tool_text)
+
+    monkeypatch.setattr(main, "embed_document", fail_for_a)
+    corpus = main.publish_corpus()
+    assert corpus.version == 2 and set(corpus.documents) == {A, B}
+    assert rows(corpus, A) == [(f"{A}-0", "old text of a")]
+
+    monkeypatch.setattr(main, "embed_document", embed_document)
+    monkeypatch.setattr(main, "_publish_failures", {A: (*main._publish_failures[A][:2], 0.0)})
+    assert rows(main.publish_corpus(), A) == [(f"{A}-0", "new text of a")]
+
+
+def test_failed_replacement_keeps_the_original(shared):
+    store(A, "node of a")
+    new_path = os.path.join(shared, f"{B}.pdf")
+    with open(new_path, "wb") as f:
+        f.write(b"not a pdf")
+
+    main.process_replacement(new_path, B, "a.pdf", A)
+    assert main.stored_document_ids() == [A]
+
+
+def test_replacement_deletes_the_original_and_its_results(shared):
+    store(A, "node of a")
+    with open(os.path.join(shared, f"{A}_findings.json"), "w") as f:
+        json.dump({}, f)
+    new_path = os.path.join(shared, f"{B}.pdf")
+    with open(new_path, "wb") as f:
+        f.write(make_report_pdf(1, 1))
+
+    main.process_replacement(new_path, B, "a.pdf", A)
+    assert main.stored_document_ids() == [B]
+    assert sorted(os.listdir(shared)) == [f"{B}.pdf", f"{B}_info.json"]
+
+
+def test_maintenance_skips_unreadable_documents_and_collects_garbage(shared):
+    with open(os.path.join(shared, f"{A}_info.json"), "w") as f:
+        f.write('{"filename": "a.pdf", "full')
+    with open(os.path.join(shared, f"{C}_findings.json"), "w") as f:
+        json.dump({}, f)
+
+    main.run_maintenance()
+    assert sorted(os.listdir(shared)) == [f"{A}_info.json"]
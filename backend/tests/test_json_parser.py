@@ -0,0 +1,68 @@
+import pytest
+
+from main import StreamingJSONParser, parse_llm_json, valid_vulnerabilities
+
+VULNERABILITY = '{"description": "A", "criticality": 9, "reasoning": "r", "mitigation": "m"}'
+PARSED_VULNERABILITY = {"description": "A", "criticality": 9, "reasoning": "r", "mitigation": "m"}
+
+# (name, opener, LLM output, expected value, expected complete)
+CASES = [
+    ("clean object", "{", '{"a": 1, "b": [true, null]}', {"a": 1, "b": [True, None]}, True),
+    ("code fence and prose", "{", 'Sure!\n```json\n{"a": 1}\n```\nHope this helps.', {"a": 1}, True),
+    ("single quotes", "{", "{'a': 'it\\'s'}", {"a": "it's"}, True),
+    ("smart quotes", "{", "{“a”: “b”}", {"a": "b"}, True),
+    ("unquoted keys and python literals", "{", "{a: True, b: None}", {"a": True, "b": None}, True),
+    ("trailing and missing commas", "{", '{"a": 1 "b": [1, 2,],}', {"a": 1, "b": [1, 2]}, True),
+    ("unescaped quote in string", "{", '{"a": "say "hi" now"}', {"a": 'say "hi" now'}, True),
+    ("raw newline in string", "{", '{"a": "x\ny"}', {"a": "x\ny"}, True),
+    ("comments", "{", '{"a": 1, // one\n/* two */ "b": 2}', {"a": 1, "b": 2}, True),
+    ("truncated object", "{", '{"a": 1, "b": {"c": 2, "d": "unfini', {"a": 1, "b": {"c": 2}}, False),
+    ("truncated key", "{", '{"a": 1, "b', {"a": 1}, False),
+    ("truncated array", "[", "[" + VULNERABILITY + ', {"description": "B", "criticality": 7, "reasoning": "Because the serv',
+     [PARSED_VULNERABILITY, {"description": "B", "criticality": 7}], False),
+    ("implicit array", "[", "Here they are:\n" + VULNERABILITY + "\n" + VULNERABILITY + "\nThat is all.",
+     [PARSED_VULNERABILITY, PARSED_VULNERABILITY], True),
+    ("implicit array with bracket in string", "[", '{"description": "see [1]", "criticality": 2}',
+     [{"description": "see [1]", "criticality": 2}], True),
+    ("bracket in prose", "[", "The list (see [below]):\n[" + VULNERABILITY + "]", [PARSED_VULNERABILITY], True),
+    ("missing brace and comma between objects", "[", '[{"description": "A", "mitigation": "m" {"description": "B"}]',
+     [{"description": "A", "mitigation": "m"}, {"description": "B"}], True),
+    ("missing brace after comma between objects", "[", '[{"a": 1, {"b": 2}]', [{"a": 1}, {"b": 2}], True),
+]
+
+
+@pytest.mark.parametrize("name, opener, text, expected, complete", CASES, ids=[case[0] for case in CASES])
+def test_parse_whole(name, opener, text, expected, complete):
+    assert parse_llm_json(text, opener) == (expected, complete)
+
+
+@pytest.mark.parametrize("name, opener, text, expected, complete", CASES, ids=[case[0] for case in CASES])
+@pytest.mark.parametrize("chunk_size", [1, 3, 7])
+def test_parse_streamed(name, opener, text, expected, complete, chunk_size):
+    parser = StreamingJSONParser(opener)
+    for start in range(0, len(text), chunk_size):
+        if parser.feed(text[start:start + chunk_size]):
+            break
+    assert parser.result() == (expected, complete)
+
+
+def test_stops_once_value_closes():
+    parser = StreamingJSONParser("{")
+    assert not parser.feed('{"a": [1, ')
+    assert parser.feed('2]} and some trailing prose')
+
+
+def test_no_json():
+    with pytest.raises(ValueError):
+        parse_llm_json("I could not find any vulnerabilities.", "[")
+
+
+def test_truncated_vulnerability_is_dropped():
+    items, complete = parse_llm_json(CASES[11][2], "[")
+    assert not complete
+    assert valid_vulnerabilities(items) == [PARSED_VULNERABILITY]
+
+
+def test_wrapped_vulnerability_list():
+    items, _ = parse_llm_json('{"vulnerabilities": [' + VULNERABILITY + "]}", "[")
+    assert valid_vulnerabilities(items) == [PARSED_VULNERABILITY]
@@ -0,0 +1,10 @@
+from main import Metrics
+
+
+def test_large_counters_keep_every_digit():
+    metrics = Metrics()
+    metrics.inc("tokens_total", 1234567, kind="prompt")
+    metrics.inc("tokens_total", 0.5, kind="ratio")
+    rendered = metrics.render()
+    assert 'tokens_total{kind="prompt"} 1234567\n' in rendered
+    assert 'tokens_total{kind="ratio"} 0.5\n' in rendered